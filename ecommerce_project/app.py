@@ -1,34 +1,262 @@
-from flask import Flask, render_template, request, session, redirect, url_for, flash, jsonify
-from utils.db import SimpleDB
-from utils.auth import SimpleAuth
+from flask import (Flask, Response, render_template, stream_template, stream_with_context, request, session,
+                   redirect, url_for, flash, get_flashed_messages, jsonify, abort, make_response)
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
+from config import Config
+from utils.db import open_db, SimpleDB
+from utils.auth import SimpleAuth, AuthBusyError
+from utils.search import ProductSearch
+from utils.categories import CategoryTree
+from utils.listing import ProductListing, SORTS, decode_cursor
+from utils.orders import OrderPage, iter_orders, valid_day, batched, csv_rows, ndjson_rows
+from utils.stats import DashboardStats
+from utils.metrics import Metrics
+from utils.page_cache import CatalogVersion, PageCache, template_stamp, make_etag, recorded
+from utils.compression import Compression, coalesce
+from utils.assets import Assets
+from utils.jobs import JobQueue
+from utils.inventory import Inventory, OutOfStockError
 import os
+import time
 from datetime import datetime
 
 app = Flask(__name__)
 app.secret_key = 'ecommerce-secret-key-2024'
 
-db = SimpleDB()
+db = open_db()
 auth = SimpleAuth()
+product_search = ProductSearch(db)
+category_tree = CategoryTree(db)
+product_listing = ProductListing(db)
+dashboard_stats = DashboardStats(db)
+catalog_version = CatalogVersion(db)
+page_cache = PageCache(Config.PAGE_CACHE_SIZE)
+templates_modified = template_stamp(os.path.join(app.root_path, app.template_folder))
+assets = Assets(os.path.join(app.root_path, Config.ASSETS_DIR), Config.ASSETS_URL, Config.ASSETS_MAX_AGE)
+job_queue = JobQueue(db)
+inventory = Inventory(db)
+
+if Config.COMPRESS_ENABLED:
+    Compression(Config.COMPRESS_LEVEL, Config.COMPRESS_BROTLI_QUALITY, Config.COMPRESS_MIN_SIZE,
+                Config.COMPRESS_MIMETYPES, Config.STREAM_CHUNK_SIZE).init_app(app)
+
+# Chỉ bọc db/auth để đo khi bật, tắt thì không tốn thêm gì
+metrics = None
+if Config.METRICS_ENABLED:
+    metrics = Metrics()
+    metrics.init_app(app, db, auth)
 
 # Helper functions
 def format_currency(amount):
     return f"{amount:,.0f} ₫"
 
 app.jinja_env.filters['currency'] = format_currency
+# URL có fingerprint / ảnh thu nhỏ do build_assets.py tạo, chưa build thì trả lại URL gốc
+app.jinja_env.globals['asset_url'] = assets.url
+app.jinja_env.globals['asset_image'] = assets.image
+
+def get_active_cart(user_id):
+    return next((c for c in db.find_by('carts.json', 'user_id', user_id) if c['active']), None)
+
+def own_cart_item(item_id):
+    """Cart item trong giỏ đang dùng của người đăng nhập; item của giỏ người khác thì 403.
+
+    Sửa/xóa item là giữ/bỏ giữ hàng nên không được làm trên giỏ của người khác.
+    """
+    item = db.get('cart_items.json', item_id)
+    if item is None:
+        return None
+    cart = db.get('carts.json', item['cart_id'])
+    if cart is None or cart['user_id'] != session['user_id']:
+        abort(403)
+    # Giỏ đã đặt hàng: item sắp bị dọn, không giữ hàng lại cho nó
+    return item if cart['active'] else None
+
+def hydrate_items(items):
+    """Gắn product, product_name và subtotal cho cart item.
+
+    Mọi sản phẩm cần dùng được tra cứu trong một lượt find_in.
+    """
+    product_ids = {item['product_id'] for item in items}
+    products_by_id = {p['id']: p for p in db.find_in('products.json', 'id', product_ids)}
+    
+    for item in items:
+        product = products_by_id.get(item['product_id'])
+        item['product'] = product
+        item['subtotal'] = product['price'] * item['quantity'] if product else 0
+        if product:
+            item['product_name'] = product['name']
+    return items
+
+def attach_order_items(orders):
+    """Gắn order_items (kèm product_name, subtotal) cho các đơn hàng.
+
+    Backend lấy item cùng tên sản phẩm trong một lượt (SQLite dùng JOIN).
+    """
+    items_by_order = {}
+    for item in db.get_order_items([order['id'] for order in orders]):
+        item['subtotal'] = item['price'] * item['quantity']
+        items_by_order.setdefault(item['order_id'], []).append(item)
+    
+    for order in orders:
+        order['order_items'] = items_by_order.get(order['id'], [])
+    return orders
+
+# Tóm tắt giỏ hàng (số lượng, tạm tính) được giữ trong session để badge
+# không phải đọc dữ liệu; các route giỏ hàng cập nhật nó từng bước.
+def load_cart_summary(user_id):
+    user_cart = get_active_cart(user_id)
+    count = subtotal = 0
+    
+    if user_cart:
+        for item in hydrate_items(db.find_by('cart_items.json', 'cart_id', user_cart['id'])):
+            count += item['quantity']
+            subtotal += item['subtotal'] if item['product'] else 0
+    
+    set_cart_summary(count, subtotal)
+
+def set_cart_summary(count, subtotal):
+    session['cart_count'] = count
+    session['cart_subtotal'] = subtotal
+
+def adjust_cart_summary(quantity, price):
+    if 'cart_count' not in session:
+        load_cart_summary(session['user_id'])
+        return
+    set_cart_summary(max(session['cart_count'] + quantity, 0),
+                     max(session['cart_subtotal'] + quantity * price, 0))
 
 def get_cart_count():
     if 'user_id' not in session:
         return 0
     
-    carts = db.load('carts.json')
-    user_cart = next((c for c in carts if c['user_id'] == session['user_id'] and c['active']), None)
+    if 'cart_count' not in session:
+        # Session tạo trước khi có tóm tắt giỏ hàng: tính một lần rồi giữ lại
+        load_cart_summary(session['user_id'])
+    return session['cart_count']
+
+def query_products(args):
+    """Một trang sản phẩm theo tham số category/search/sort/cursor của request"""
+    category_id = args.get('category', type=int)
+    search = args.get('search', '')
+    limit = min(args.get('limit', Config.PAGE_SIZE, type=int), 100)
     
-    if not user_cart:
-        return 0
+    # Gồm cả sản phẩm của danh mục con cháu ở mọi cấp
+    product_ids = category_tree.product_ids(category_id) if category_id else None
+    # Kết quả theo thứ tự liên quan, tìm cả khi gõ không dấu
+    ranked_ids = product_search.search(search) if search else None
+    
+    return product_listing.page(args.get('sort', 'default'), args.get('cursor'),
+                                max(limit, 1), product_ids, ranked_ids)
+
+def hydrate_orders(orders):
+    """Gắn order_items, user_name, user_email cho một lô đơn hàng"""
+    attach_order_items(orders)
+    users_by_id = {u['id']: u for u in db.find_in('users.json', 'id', {o['user_id'] for o in orders})}
+    
+    for order in orders:
+        user = users_by_id.get(order['user_id'])
+        order['user_name'] = user['name'] if user else 'Unknown'
+        order['user_email'] = user['email'] if user else None
+    return orders
+
+# Trang lớn được render dạng stream: byte đầu tiên đi ra trước khi dựng xong cả trang
+def stream_page(chunks):
+    # Session được lưu trước khi body bắt đầu stream nên phải lấy flash ra ngay bây giờ
+    get_flashed_messages(with_categories=True)
+    return Response(coalesce(chunks, Config.STREAM_CHUNK_SIZE))
+
+# Trang danh mục (trang chủ, /products, /product/<id>) giống nhau với mọi người xem,
+# chỉ khác phần khung base.html (tên, quyền, số món trong giỏ, thông báo). Nội dung được
+# render một lần cho mỗi phiên bản danh mục, khung thì render theo từng người.
+def render_blocks(template_name, context):
+    """Block title (render ngay) và content (render dần khi được duyệt) của template,
+    không gồm khung base.html"""
+    template = app.jinja_env.get_template(template_name)
+    app.update_template_context(context)
+    blocks = template.new_context(context)
+    title = Markup(''.join(template.blocks['title'](blocks)))
+    return title, (Markup(chunk) for chunk in template.blocks['content'](blocks))
+
+def cache_get(version, key):
+    return page_cache.get(version, key) if Config.PAGE_CACHE_ENABLED else None
+
+def cache_put(version, key, value):
+    if Config.PAGE_CACHE_ENABLED:
+        page_cache.put(version, key, value)
+
+def catalog_page(template_name, key, build_context):
+    """Response của một trang danh mục với ETag/Last-Modified theo phiên bản danh mục.
+
+    build_context() chỉ được gọi khi cache chưa có nội dung; nó trả None khi trang
+    không tồn tại và khi đó hàm này cũng trả None. If-None-Match khớp thì trả 304
+    mà không render gì. Chưa có trong cache thì trang được stream, đồng thời ghi lại
+    để đưa vào cache khi đã render xong.
+    """
+    catalog, updated_at = catalog_version.current()
+    # Build lại file tĩnh thì URL ảnh trong trang đã cache cũng đổi
+    version = (catalog, assets.version())
+    viewer = None
+    if 'user_id' in session:
+        viewer = (session['user_id'], session.get('user_name'), session.get('role'), get_cart_count())
+    # Còn thông báo flash thì phải render để hiện ra nên không dùng ETag/cache cả trang
+    shared = not session.get('_flashes')
+    etag = make_etag(version, templates_modified.timestamp(), key, viewer)
+    # Khung của người đã đăng nhập đổi theo giỏ hàng nên chỉ khách mới có Last-Modified
+    last_modified = max(updated_at, templates_modified, assets.modified()) if viewer is None else None
+    # Khách chưa đăng nhập (phần lớn lượt xem) dùng chung cả trang đã render
+    whole_page = shared and viewer is None
+    
+    if shared and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = app.response_class(status=304)
+    else:
+        page = cache_get(version, ('page', key)) if whole_page else None
+        if page is not None:
+            response = make_response(page)
+        else:
+            blocks = cache_get(version, ('blocks', key))
+            if blocks is None:
+                context = build_context()
+                if context is None:
+                    return None
+                title, content = render_blocks(template_name, context)
+                blocks = {'title': title, 'content': recorded(content, lambda parts: cache_put(
+                    version, ('blocks', key), {'title': title, 'content': [Markup(''.join(parts))]}))}
+            
+            chunks = stream_template(template_name, page_blocks=blocks, cart_count=viewer[3] if viewer else 0)
+            if whole_page:
+                chunks = recorded(chunks, lambda parts: cache_put(version, ('page', key), ''.join(parts)))
+            response = stream_page(chunks)
+    
+    if shared:
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        if viewer is None:
+            response.last_modified = last_modified
+            response.cache_control.public = True
+        else:
+            response.cache_control.private = True
+    else:
+        response.cache_control.no_store = True
+    return response
+
+def order_filters(args):
+    """Bộ lọc đơn hàng (status, date_from, date_to, user là email hoặc id) từ query string"""
+    filters = {
+        'status': args.get('status') or None,
+        'date_from': valid_day(args.get('date_from')),
+        'date_to': valid_day(args.get('date_to')),
+        'user_id': None
+    }
     
-    cart_items = db.load('cart_items.json')
-    user_items = [item for item in cart_items if item['cart_id'] == user_cart['id']]
-    return sum(item['quantity'] for item in user_items)
+    user = args.get('user', '').strip()
+    if user.isdigit():
+        filters['user_id'] = int(user)
+    elif user:
+        found = db.find_by('users.json', 'email', user)
+        # Email không tồn tại thì lọc theo id không có thật để trả về trang rỗng
+        filters['user_id'] = found[0]['id'] if found else 0
+    return filters
 
 def require_admin():
     if 'user_id' not in session or session.get('role') != 'admin':
@@ -40,15 +268,58 @@ def require_login():
         flash('Vui lòng đăng nhập!', 'error')
         return redirect(url_for('login'))
 
+def warm_up():
+    """Nạp sẵn các bảng, chỉ mục, cache dẫn xuất và template vào bộ nhớ.
+
+    serve.py gọi hàm này trong process chính trước khi fork để các worker dùng
+    chung (copy-on-write) thay vì mỗi worker tự đọc lại ở những request đầu tiên.
+    """
+    for filename, fields in SimpleDB.INDEXES.items():
+        for field in fields:
+            if isinstance(field, str):
+                db.find_by(filename, field, None)
+    product_listing.count()
+    category_tree.options()
+    # Từ bất kỳ, chỉ để dựng chỉ mục tìm kiếm
+    product_search.search('warm up')
+    catalog_version.current()
+    assets.manifest()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    db.close()
+
 # ==================== ROUTES ====================
 
+@app.before_request
+def start_workers():
+    # Mỗi process phục vụ request (kể cả worker gunicorn sau khi fork) có worker hàng đợi
+    # và thread dọn lượt giữ hàng riêng
+    job_queue.start()
+    inventory.start()
+
 @app.route('/')
 def home():
-    products = db.load('products.json')
-    return render_template('index.html', products=products, cart_count=get_cart_count())
+    def context():
+        products, next_cursor = product_listing.page(limit=Config.PAGE_SIZE)
+        return {'products': products, 'has_more': next_cursor is not None}
+    
+    return catalog_page('index.html', ('home',), context)
+
+@app.route(Config.ASSETS_URL + '<path:filename>')
+def asset_file(filename):
+    response = assets.send(filename)
+    if response is None:
+        abort(404)
+    return response
 
 # ==================== AUTHENTICATION ====================
 
+@app.errorhandler(AuthBusyError)
+def auth_busy(error):
+    flash('Hệ thống đang bận, vui lòng thử lại sau giây lát!', 'error')
+    template = 'register.html' if request.endpoint == 'register' else 'login.html'
+    return render_template(template), 503, {'Retry-After': str(Config.AUTH_RETRY_AFTER)}
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -56,21 +327,27 @@ def register():
         email = request.form['email']
         password = request.form['password']
         
-        users = db.load('users.json')
-        
-        if any(user['email'] == email for user in users):
+        if db.find_by('users.json', 'email', email):
             flash('Email đã tồn tại!', 'error')
             return render_template('register.html')
         
-        new_user = {
-            'id': db.get_next_id(users),
-            'name': name,
-            'email': email,
-            'password_hash': auth.hash_password(password),
-            'role': 'user'
-        }
-        users.append(new_user)
-        db.save('users.json', users)
+        # Hash trước khi vào giao dịch để không giữ khóa ghi trong lúc chạy bcrypt
+        password_hash = auth.hash_password(password)
+        
+        with db.transaction():
+            if db.find_by('users.json', 'email', email):
+                flash('Email đã tồn tại!', 'error')
+                return render_template('register.html')
+            
+            new_user = {
+                'id': db.next_id('users.json'),
+                'name': name,
+                'email': email,
+                'password_hash': password_hash,
+                'role': 'user'
+            }
+            db.insert('users.json', new_user)
+            dashboard_stats.user_registered(new_user)
         
         flash('Đăng ký thành công! Hãy đăng nhập.', 'success')
         return redirect(url_for('login'))
@@ -83,14 +360,20 @@ def login():
         email = request.form['email']
         password = request.form['password']
         
-        users = db.load('users.json')
-        user = next((u for u in users if u['email'] == email), None)
+        user = next(iter(db.find_by('users.json', 'email', email)), None)
         
         if user and auth.verify_password(password, user['password_hash']):
+            if auth.needs_rehash(user['password_hash']):
+                try:
+                    db.update('users.json', user['id'], {'password_hash': auth.hash_password(password)})
+                except AuthBusyError:
+                    # Băm lại không bắt buộc, để dành cho lần đăng nhập sau
+                    pass
             session['user_id'] = user['id']
             session['user_name'] = user['name']
             session['role'] = user['role']
             session['user_email'] = user['email']
+            load_cart_summary(user['id'])
             
             if user['role'] == 'admin':
                 flash(f'Chào mừng admin {user["name"]}!', 'success')
@@ -112,273 +395,309 @@ def logout():
 
 @app.route('/products')
 def products():
-    category_id = request.args.get('category', type=int)
-    search = request.args.get('search', '')
-    
-    all_products = db.load('products.json')
-    categories = db.load('categories.json')
-    
-    filtered_products = all_products
-    
-    if category_id:
-        subcategory_ids = [cat['id'] for cat in categories if cat['parent_id'] == category_id]
-        
-        if subcategory_ids:
-            filtered_products = [p for p in filtered_products if p['category_id'] in subcategory_ids]
-        else:
-            filtered_products = [p for p in filtered_products if p['category_id'] == category_id]
-    
-    if search:
-        filtered_products = [p for p in filtered_products if search.lower() in p['name'].lower()]
+    def context():
+        page_products, next_cursor = query_products(request.args)
+        return {
+            'products': page_products,
+            'categories': category_tree.options(),
+            'selected_category': request.args.get('category', type=int),
+            'search_query': request.args.get('search', ''),
+            'sorts': SORTS,
+            'selected_sort': request.args.get('sort', 'default'),
+            'cursor': request.args.get('cursor'),
+            'next_cursor': next_cursor
+        }
     
-    return render_template('products.html', 
-                         products=filtered_products,
-                         categories=categories,
-                         selected_category=category_id,
-                         search_query=search,
-                         cart_count=get_cart_count())
+    # Trang chỉ phụ thuộc query string (danh mục, tìm kiếm, sắp xếp, cursor)
+    key = ('products',) + tuple(sorted(request.args.items(multi=True)))
+    return catalog_page('products.html', key, context)
+
+@app.route('/api/products')
+def api_products():
+    # Dùng cho cuộn vô hạn: gọi lại với cursor=next_cursor đến khi nhận None
+    page_products, next_cursor = query_products(request.args)
+    return jsonify({'products': [dict(product) for product in page_products], 'next_cursor': next_cursor})
 
 @app.route('/product/<int:product_id>')
 def product_detail(product_id):
-    products = db.load('products.json')
-    product = next((p for p in products if p['id'] == product_id), None)
+    def context():
+        product = db.get('products.json', product_id)
+        return {'product': product} if product else None
     
-    if not product:
+    response = catalog_page('product_detail.html', ('product', product_id), context)
+    if response is None:
         flash('Sản phẩm không tồn tại!', 'error')
         return redirect(url_for('products'))
-    
-    return render_template('product_detail.html', product=product, cart_count=get_cart_count())
+    return response
 
 # ==================== CART & ORDERS (USER) ====================
 
 @app.route('/cart')
 def cart():
-    require_login()
+    denied = require_login()
+    if denied:
+        return denied
     
-    carts = db.load('carts.json')
-    user_cart = next((c for c in carts if c['user_id'] == session['user_id'] and c['active']), None)
+    user_cart = get_active_cart(session['user_id'])
     
     if not user_cart:
+        set_cart_summary(0, 0)
         return render_template('cart.html', cart_items=[], total=0, cart_count=0)
     
-    cart_items = db.load('cart_items.json')
-    user_items = [item for item in cart_items if item['cart_id'] == user_cart['id']]
+    user_items = hydrate_items(db.find_by('cart_items.json', 'cart_id', user_cart['id']))
+    total = sum(item['subtotal'] for item in user_items if item['product'])
     
-    total = 0
-    for item in user_items:
-        product = next((p for p in db.load('products.json') if p['id'] == item['product_id']), None)
-        if product:
-            item['product'] = product
-            item['subtotal'] = product['price'] * item['quantity']
-            total += item['subtotal']
+    # Đã đọc đủ giỏ hàng nên đồng bộ lại tóm tắt (giá có thể đã đổi)
+    set_cart_summary(sum(item['quantity'] for item in user_items), total)
     
     return render_template('cart.html', cart_items=user_items, total=total, cart_count=get_cart_count())
 
 @app.route('/add_to_cart/<int:product_id>')
 def add_to_cart(product_id):
-    require_login()
+    denied = require_login()
+    if denied:
+        return denied
     
-    carts = db.load('carts.json')
-    user_cart = next((c for c in carts if c['user_id'] == session['user_id'] and c['active']), None)
-    
-    if not user_cart:
-        user_cart = {
-            'id': db.get_next_id(carts),
-            'user_id': session['user_id'],
-            'active': True
-        }
-        carts.append(user_cart)
-        db.save('carts.json', carts)
+    product = db.get('products.json', product_id)
+    if not product:
+        flash('Sản phẩm không tồn tại!', 'error')
+        return redirect(url_for('products'))
     
-    cart_items = db.load('cart_items.json')
-    existing_item = next((item for item in cart_items 
-                         if item['cart_id'] == user_cart['id'] and item['product_id'] == product_id), None)
+    # Hết hàng (kể cả đang được giỏ khác giữ) thì báo ngay, không tranh khóa ghi với người đang mua
+    if inventory.available(product) <= 0:
+        flash(f'Sản phẩm {product["name"]} đã hết hàng!', 'error')
+        return redirect(request.referrer or url_for('products'))
     
-    if existing_item:
-        existing_item['quantity'] += 1
-    else:
-        new_item = {
-            'id': db.get_next_id(cart_items),
-            'cart_id': user_cart['id'],
-            'product_id': product_id,
-            'quantity': 1
-        }
-        cart_items.append(new_item)
+    try:
+        with db.transaction():
+            user_cart = get_active_cart(session['user_id'])
+            
+            if not user_cart:
+                user_cart = {
+                    'id': db.next_id('carts.json'),
+                    'user_id': session['user_id'],
+                    'active': True
+                }
+                db.insert('carts.json', user_cart)
+            
+            existing = db.find_by('cart_items.json', ('cart_id', 'product_id'), (user_cart['id'], product_id))
+            quantity = existing[0]['quantity'] + 1 if existing else 1
+            inventory.hold(user_cart['id'], product, quantity)
+            
+            if existing:
+                db.update('cart_items.json', existing[0]['id'], {'quantity': quantity})
+            else:
+                new_item = {
+                    'id': db.next_id('cart_items.json'),
+                    'cart_id': user_cart['id'],
+                    'product_id': product_id,
+                    'quantity': 1
+                }
+                db.insert('cart_items.json', new_item)
+    except OutOfStockError:
+        flash(f'Sản phẩm {product["name"]} đã hết hàng!', 'error')
+        return redirect(request.referrer or url_for('products'))
     
-    db.save('cart_items.json', cart_items)
+    adjust_cart_summary(1, product['price'])
     flash('Đã thêm vào giỏ hàng!', 'success')
     return redirect(request.referrer or url_for('products'))
 
 @app.route('/update_cart/<int:item_id>', methods=['POST'])
 def update_cart(item_id):
-    require_login()
+    denied = require_login()
+    if denied:
+        return denied
     
     new_quantity = int(request.form['quantity'])
     
     if new_quantity <= 0:
         return remove_from_cart(item_id)
     
-    cart_items = db.load('cart_items.json')
-    item = next((item for item in cart_items if item['id'] == item_id), None)
-    
+    item = own_cart_item(item_id)
     if item:
-        item['quantity'] = new_quantity
-        db.save('cart_items.json', cart_items)
+        product = db.get('products.json', item['product_id'])
+        try:
+            with db.transaction():
+                if product:
+                    inventory.hold(item['cart_id'], product, new_quantity)
+                db.update('cart_items.json', item_id, {'quantity': new_quantity})
+        except OutOfStockError as e:
+            flash(f'Sản phẩm {product["name"]} chỉ còn {e.available} sản phẩm!', 'error')
+            return redirect(url_for('cart'))
+        adjust_cart_summary(new_quantity - item['quantity'], product['price'] if product else 0)
         flash('Đã cập nhật giỏ hàng!', 'success')
     
     return redirect(url_for('cart'))
 
 @app.route('/remove_from_cart/<int:item_id>')
 def remove_from_cart(item_id):
-    require_login()
+    denied = require_login()
+    if denied:
+        return denied
     
-    cart_items = db.load('cart_items.json')
-    cart_items = [item for item in cart_items if item['id'] != item_id]
-    db.save('cart_items.json', cart_items)
+    item = own_cart_item(item_id)
+    if item:
+        with db.transaction():
+            db.delete('cart_items.json', item_id)
+            inventory.release(item['cart_id'], item['product_id'])
+        product = db.get('products.json', item['product_id'])
+        adjust_cart_summary(-item['quantity'], product['price'] if product else 0)
     flash('Đã xóa sản phẩm khỏi giỏ hàng!', 'success')
     return redirect(url_for('cart'))
 
 @app.route('/checkout', methods=['GET', 'POST'])
 def checkout():
-    require_login()
+    denied = require_login()
+    if denied:
+        return denied
     
     if request.method == 'POST':
-        carts = db.load('carts.json')
-        user_cart = next((c for c in carts if c['user_id'] == session['user_id'] and c['active']), None)
-        
-        if not user_cart:
-            flash('Giỏ hàng trống!', 'error')
-            return redirect(url_for('cart'))
-        
-        cart_items = db.load('cart_items.json')
-        user_items = [item for item in cart_items if item['cart_id'] == user_cart['id']]
-        
-        if not user_items:
-            flash('Giỏ hàng trống!', 'error')
-            return redirect(url_for('cart'))
-        
-        total = 0
-        products = db.load('products.json')
-        
-        for item in user_items:
-            product = next((p for p in products if p['id'] == item['product_id']), None)
-            if product:
-                if product['stock'] < item['quantity']:
-                    flash(f'Sản phẩm {product["name"]} không đủ số lượng!', 'error')
+        # Trừ tồn kho (phần đã giữ khi thêm vào giỏ) và ghi đơn hàng trong cùng một giao dịch
+        try:
+            with db.transaction():
+                user_cart = get_active_cart(session['user_id'])
+            
+                if not user_cart:
+                    flash('Giỏ hàng trống!', 'error')
                     return redirect(url_for('cart'))
-                total += product['price'] * item['quantity']
-        
-        orders = db.load('orders.json')
-        new_order = {
-            'id': db.get_next_id(orders),
-            'user_id': session['user_id'],
-            'total': total,
-            'status': 'pending',
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        orders.append(new_order)
-        db.save('orders.json', orders)
-        
-        order_items = db.load('order_items.json')
-        for item in user_items:
-            product = next((p for p in products if p['id'] == item['product_id']), None)
-            if product:
-                new_order_item = {
-                    'id': db.get_next_id(order_items),
-                    'order_id': new_order['id'],
-                    'product_id': item['product_id'],
-                    'quantity': item['quantity'],
-                    'price': product['price']
+            
+                user_items = hydrate_items(db.find_by('cart_items.json', 'cart_id', user_cart['id']))
+            
+                if not user_items:
+                    flash('Giỏ hàng trống!', 'error')
+                    return redirect(url_for('cart'))
+            
+                user_items = [item for item in user_items if item['product']]
+                # Thiếu hàng thì raise, cả giao dịch bị hủy
+                sold_out = inventory.confirm(user_cart['id'], [(item['product'], item['quantity']) for item in user_items])
+                total = sum(item['subtotal'] for item in user_items)
+            
+                new_order = {
+                    'id': db.next_id('orders.json'),
+                    'user_id': session['user_id'],
+                    'total': total,
+                    'status': 'pending',
+                    'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 }
-                order_items.append(new_order_item)
-                product['stock'] -= item['quantity']
-        
-        db.save('order_items.json', order_items)
-        db.save('products.json', products)
-        
-        user_cart['active'] = False
-        db.save('carts.json', carts)
-        
-        cart_items = [item for item in cart_items if item['cart_id'] != user_cart['id']]
-        db.save('cart_items.json', cart_items)
+                db.insert('orders.json', new_order)
+            
+                for item in user_items:
+                    new_order_item = {
+                        'id': db.next_id('order_items.json'),
+                        'order_id': new_order['id'],
+                        'product_id': item['product_id'],
+                        'quantity': item['quantity'],
+                        'price': item['product']['price']
+                    }
+                    db.insert('order_items.json', new_order_item)
+                # Tồn kho hiện trên trang danh mục: hết hàng thì làm mới ngay, còn lại thì gộp
+                if sold_out:
+                    catalog_version.bump()
+                else:
+                    refresh_catalog_later()
+            
+                # Thống kê cộng trong cùng giao dịch (O(1)): rebuild() đếm đơn đã ghi nên
+                # không thể để việc chạy sau cộng thêm lần nữa
+                dashboard_stats.order_placed(new_order)
+                # Giỏ hàng thôi active ngay để không đặt lại được lần nữa; dọn item của giỏ
+                # chạy sau (cùng giao dịch nên đơn hàng có thì việc cũng có)
+                db.update('carts.json', user_cart['id'], {'active': False})
+                job_queue.enqueue('order_placed', {'order_id': new_order['id'], 'cart_id': user_cart['id']},
+                                  key=f"order_placed:{new_order['id']}")
+        except OutOfStockError as e:
+            flash(f'Sản phẩm {e.product["name"]} không đủ số lượng!', 'error')
+            return redirect(url_for('cart'))
         
+        set_cart_summary(0, 0)
         flash('Đặt hàng thành công! Cảm ơn bạn đã mua sắm.', 'success')
         return redirect(url_for('order_history'))
     
-    carts = db.load('carts.json')
-    user_cart = next((c for c in carts if c['user_id'] == session['user_id'] and c['active']), None)
+    user_cart = get_active_cart(session['user_id'])
     
     if not user_cart:
         flash('Giỏ hàng trống!', 'error')
         return redirect(url_for('cart'))
     
-    cart_items = db.load('cart_items.json')
-    user_items = [item for item in cart_items if item['cart_id'] == user_cart['id']]
+    user_items = hydrate_items(db.find_by('cart_items.json', 'cart_id', user_cart['id']))
     
     if not user_items:
         flash('Giỏ hàng trống!', 'error')
         return redirect(url_for('cart'))
     
-    total = 0
-    products = db.load('products.json')
-    for item in user_items:
-        product = next((p for p in products if p['id'] == item['product_id']), None)
-        if product:
-            total += product['price'] * item['quantity']
+    total = sum(item['subtotal'] for item in user_items if item['product'])
     
     return render_template('checkout.html', total=total, cart_count=get_cart_count())
 
+def refresh_catalog_later():
+    """Gộp các lần tồn kho đổi trong CATALOG_REFRESH_INTERVAL giây thành một lần bump phiên bản danh mục.
+
+    Sản phẩm bán chạy không làm mất cache trang danh mục của mọi người sau từng đơn hàng.
+    """
+    interval = Config.CATALOG_REFRESH_INTERVAL
+    if not interval:
+        catalog_version.bump()
+        return
+    # Một việc cho mỗi khoảng thời gian, chạy ở cuối khoảng đó
+    now = time.time()
+    boundary = (int(now // interval) + 1) * interval
+    job_queue.enqueue('catalog_refresh', {}, key=f'catalog_refresh:{boundary}', delay=boundary - now)
+
+@job_queue.handler('catalog_refresh')
+def catalog_refresh_job(job):
+    catalog_version.bump()
+
+@job_queue.handler('order_placed')
+def order_placed_job(job):
+    """Phần việc sau khi đặt hàng không cần xong trước khi trả trang cho khách"""
+    payload = job['payload']
+    for item in db.find_by('cart_items.json', 'cart_id', payload['cart_id']):
+        db.delete('cart_items.json', item['id'])
+
 @app.route('/orders')
 def order_history():
-    require_login()
+    denied = require_login()
+    if denied:
+        return denied
     
-    orders = db.load('orders.json')
-    user_orders = [order for order in orders if order['user_id'] == session['user_id']]
+    user_orders = db.find_by('orders.json', 'user_id', session['user_id'])
     
-    order_items = db.load('order_items.json')
-    products = db.load('products.json')
-    
-    for order in user_orders:
-        order['order_items'] = [item for item in order_items if item['order_id'] == order['id']]
-        for item in order['order_items']:
-            product = next((p for p in products if p['id'] == item['product_id']), None)
-            if product:
-                item['product_name'] = product['name']
-    
-    return render_template('orders.html', orders=user_orders, cart_count=get_cart_count())
+    # Item của đơn được gắn theo từng lô khi template render tới
+    orders = OrderPage(user_orders, len(user_orders), attach_order_items)
+    return stream_page(stream_template('orders.html', orders=orders, has_orders=bool(user_orders),
+                                       cart_count=get_cart_count()))
 
 # ==================== ADMIN ROUTES ====================
 
 @app.route('/admin')
 def admin_dashboard():
-    require_admin()
-    
-    orders = db.load('orders.json')
-    products = db.load('products.json')
-    users = db.load('users.json')
-    
-    stats = {
-        'total_orders': len(orders),
-        'total_products': len(products),
-        'total_users': len([u for u in users if u['role'] == 'user']),
-        'total_revenue': sum(order['total'] for order in orders),
-        'pending_orders': len([o for o in orders if o['status'] == 'pending'])
-    }
+    denied = require_admin()
+    if denied:
+        return denied
     
-    return render_template('admin/dashboard.html', stats=stats, cart_count=get_cart_count())
+    stats = dashboard_stats.summary()
+    return render_template('admin/dashboard.html', stats=stats, jobs=job_queue.stats(),
+                           cart_count=get_cart_count())
 
 @app.route('/admin/products')
 def admin_products():
-    require_admin()
+    denied = require_admin()
+    if denied:
+        return denied
     
-    products = db.load('products.json')
+    sort = request.args.get('sort', 'default')
+    products, next_cursor = product_listing.page(sort, request.args.get('cursor'), Config.PAGE_SIZE)
     categories = db.load('categories.json')
     
-    return render_template('admin/products.html', products=products, categories=categories, cart_count=get_cart_count())
+    return render_template('admin/products.html', products=products, categories=categories,
+                           total_products=product_listing.count(), sorts=SORTS, selected_sort=sort,
+                           cursor=request.args.get('cursor'), next_cursor=next_cursor,
+                           cart_count=get_cart_count())
 
 @app.route('/admin/products/add', methods=['GET', 'POST'])
 def admin_add_product():
-    require_admin()
+    denied = require_admin()
+    if denied:
+        return denied
     
     if request.method == 'POST':
         name = request.form['name']
@@ -388,20 +707,20 @@ def admin_add_product():
         description = request.form['description']
         image = request.form['image']
         
-        products = db.load('products.json')
-        
-        new_product = {
-            'id': db.get_next_id(products),
-            'name': name,
-            'price': price,
-            'stock': stock,
-            'category_id': category_id,
-            'description': description,
-            'image': image
-        }
-        
-        products.append(new_product)
-        db.save('products.json', products)
+        with db.transaction():
+            new_product = {
+                'id': db.next_id('products.json'),
+                'name': name,
+                'price': price,
+                'stock': stock,
+                'category_id': category_id,
+                'description': description,
+                'image': image
+            }
+            
+            db.insert('products.json', new_product)
+            dashboard_stats.product_added()
+            catalog_version.bump()
         
         flash('Thêm sản phẩm thành công!', 'success')
         return redirect(url_for('admin_products'))
@@ -411,24 +730,28 @@ def admin_add_product():
 
 @app.route('/admin/products/<int:product_id>/edit', methods=['GET', 'POST'])
 def admin_edit_product(product_id):
-    require_admin()
+    denied = require_admin()
+    if denied:
+        return denied
     
-    products = db.load('products.json')
-    product = next((p for p in products if p['id'] == product_id), None)
+    product = db.get('products.json', product_id)
     
     if not product:
         flash('Sản phẩm không tồn tại!', 'error')
         return redirect(url_for('admin_products'))
     
     if request.method == 'POST':
-        product['name'] = request.form['name']
-        product['price'] = int(request.form['price'])
-        product['stock'] = int(request.form['stock'])
-        product['category_id'] = int(request.form['category_id'])
-        product['description'] = request.form['description']
-        product['image'] = request.form['image']
+        with db.transaction():
+            db.update('products.json', product_id, {
+                'name': request.form['name'],
+                'price': int(request.form['price']),
+                'stock': int(request.form['stock']),
+                'category_id': int(request.form['category_id']),
+                'description': request.form['description'],
+                'image': request.form['image']
+            })
+            catalog_version.bump()
         
-        db.save('products.json', products)
         flash('Cập nhật sản phẩm thành công!', 'success')
         return redirect(url_for('admin_products'))
     
@@ -437,52 +760,85 @@ def admin_edit_product(product_id):
 
 @app.route('/admin/products/<int:product_id>/delete', methods=['POST'])
 def admin_delete_product(product_id):
-    require_admin()
-    
-    products = db.load('products.json')
-    products = [p for p in products if p['id'] != product_id]
-    
-    db.save('products.json', products)
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    with db.transaction():
+        if db.get('products.json', product_id):
+            db.delete('products.json', product_id)
+            dashboard_stats.product_removed()
+            catalog_version.bump()
     flash('Xóa sản phẩm thành công!', 'success')
     return redirect(url_for('admin_products'))
 
 @app.route('/admin/orders')
 def admin_orders():
-    require_admin()
+    denied = require_admin()
+    if denied:
+        return denied
     
-    orders = db.load('orders.json')
-    order_items = db.load('order_items.json')
-    products = db.load('products.json')
-    users = db.load('users.json')
+    filters = order_filters(request.args)
+    position = decode_cursor(request.args.get('cursor'))
+    before_id = position[0] if position and isinstance(position[0], int) else None
     
-    for order in orders:
-        order['user_name'] = next((u['name'] for u in users if u['id'] == order['user_id']), 'Unknown')
-        order['order_items'] = [item for item in order_items if item['order_id'] == order['id']]
-        for item in order['order_items']:
-            product = next((p for p in products if p['id'] == item['product_id']), None)
-            if product:
-                item['product_name'] = product['name']
+    # Chỉ một trang được gắn dữ liệu, theo từng lô khi template render tới
+    orders = OrderPage(iter_orders(db, before_id=before_id, **filters), Config.PAGE_SIZE, hydrate_orders)
+    totals = None if any(filters.values()) else dashboard_stats.summary()
     
-    return render_template('admin/orders.html', orders=orders, cart_count=get_cart_count())
+    return stream_page(stream_template('admin/orders.html', orders=orders, totals=totals,
+                                       args=request.args, cursor=request.args.get('cursor'),
+                                       cart_count=get_cart_count()))
+
+@app.route('/admin/orders/export')
+def admin_export_orders():
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    filters = order_filters(request.args)
+    orders = (order for batch in batched(iter_orders(db, **filters)) for order in hydrate_orders(batch))
+    
+    if request.args.get('format') == 'ndjson':
+        body, mimetype, extension = ndjson_rows(orders), 'application/x-ndjson', 'ndjson'
+    else:
+        body, mimetype, extension = csv_rows(orders), 'text/csv', 'csv'
+    
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=orders.{extension}'})
 
 @app.route('/admin/orders/<int:order_id>/update', methods=['POST'])
 def admin_update_order(order_id):
-    require_admin()
+    denied = require_admin()
+    if denied:
+        return denied
     
     new_status = request.form['status']
-    orders = db.load('orders.json')
-    
-    order = next((o for o in orders if o['id'] == order_id), None)
+    with db.transaction():
+        order = db.get('orders.json', order_id)
+        if order:
+            db.update('orders.json', order_id, {'status': new_status})
+            dashboard_stats.order_status_changed(order['status'], new_status)
     if order:
-        order['status'] = new_status
-        db.save('orders.json', orders)
         flash('Cập nhật trạng thái đơn hàng thành công!', 'success')
     
     return redirect(url_for('admin_orders'))
 
+@app.route('/admin/metrics')
+def admin_metrics():
+    if metrics is None:
+        abort(404)
+    
+    if not metrics.authorized():
+        abort(403)
+    
+    return Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/admin/users')
 def admin_users():
-    require_admin()
+    denied = require_admin()
+    if denied:
+        return denied
     
     users = db.load('users.json')
     return render_template('admin/users.html', users=users, cart_count=get_cart_count())
@@ -497,6 +853,7 @@ if __name__ == '__main__':
         print("   User:  user@example.com / user123")
         print("=" * 50)
         print("🌐 TRUY CẬP: http://localhost:5000")
+        print("   (server phát triển; chạy thật dùng: python serve.py)")
         print("=" * 50)
     except Exception as e:
         print(f"Lỗi khi khởi tạo dữ liệu: {e}")
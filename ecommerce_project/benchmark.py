@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from config import Config
+
+TABLES = ['products.json', 'users.json', 'orders.json', 'order_items.json', 'carts.json', 'cart_items.json']
+
+def measure(fn, iterations, warmup=1):
+    """Chạy fn nhiều lần, trả về thống kê thời gian (ms)"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'mean_ms': round(sum(samples) / len(samples), 3)
+    }
+
+def fetch(client, method, url, expected=(200,), **kwargs):
+    response = client.open(url, method=method, **kwargs)
+    # Đọc hết body để tính cả thời gian của response dạng stream
+    response.get_data()
+    if response.status_code not in expected:
+        raise RuntimeError(f'{method} {url} -> {response.status_code}')
+    return response
+
+def login(client, email, password):
+    fetch(client, 'POST', '/login', (302,), data={'email': email, 'password': password})
+
+# ==================== KỊCH BẢN QUA FLASK TEST CLIENT ====================
+
+def web_scenarios(web, rng):
+    products = web.db.load('products.json')
+    product_ids = [p['id'] for p in products]
+    category_ids = [c['id'] for c in web.db.load('categories.json')]
+    words = [word for p in rng.sample(products, min(50, len(products))) for word in p['name'].split()[:2]]
+
+    guest = web.app.test_client()
+    customer = web.app.test_client()
+    login(customer, 'user@example.com', 'user123')
+    admin = web.app.test_client()
+    login(admin, 'admin@example.com', 'admin123')
+
+    def browse():
+        fetch(guest, 'GET', '/')
+        fetch(guest, 'GET', '/products')
+        fetch(guest, 'GET', f'/products?category={rng.choice(category_ids)}&sort=price_asc')
+        fetch(guest, 'GET', f'/product/{rng.choice(product_ids)}')
+
+    def search():
+        fetch(guest, 'GET', f'/products?search={rng.choice(words)}')
+        fetch(guest, 'GET', f'/api/products?search={rng.choice(words)[:3]}')
+
+    def add_to_cart():
+        fetch(customer, 'GET', f'/add_to_cart/{rng.choice(product_ids)}', (302,))
+        fetch(customer, 'GET', '/cart')
+
+    def checkout():
+        fetch(customer, 'GET', f'/add_to_cart/{rng.choice(product_ids)}', (302,))
+        fetch(customer, 'POST', '/checkout', (302,))
+
+    def admin_pages():
+        fetch(admin, 'GET', '/admin')
+        fetch(admin, 'GET', '/admin/products')
+        fetch(admin, 'GET', '/admin/orders?status=pending')
+
+    def admin_export():
+        fetch(admin, 'GET', f'/admin/orders/export?format=ndjson&date_from={datetime.now():%Y-%m-%d}')
+
+    def login_flow():
+        login(web.app.test_client(), 'user@example.com', 'user123')
+
+    return {
+        'web.browse': browse,
+        'web.search': search,
+        'web.add_to_cart': add_to_cart,
+        'web.checkout': checkout,
+        'web.admin_pages': admin_pages,
+        'web.admin_export': admin_export,
+        'web.login': login_flow
+    }
+
+# ==================== MICRO-BENCHMARK SimpleDB ====================
+
+def db_scenarios(rows, scratch_dir):
+    from utils.db import SimpleDB, CODECS
+
+    data_dir = Config.DATA_DIR
+    Config.DATA_DIR = scratch_dir
+    try:
+        scratch = SimpleDB()
+    finally:
+        Config.DATA_DIR = data_dir
+    scratch.save('products.json', rows)
+    next_id = [max((row['id'] for row in rows), default=0) + 1]
+
+    def cold_load():
+        scratch.invalidate('products.json')
+        scratch.load('products.json')
+
+    def insert():
+        scratch.insert('products.json', dict(rows[0], id=next_id[0]))
+        next_id[0] += 1
+
+    def update():
+        scratch.update('products.json', rows[0]['id'], {'stock': next_id[0]})
+
+    scenarios = {
+        'db.load_hot': lambda: scratch.load('products.json'),
+        'db.load_cold': cold_load,
+        'db.save': lambda: scratch.save('products.json', rows),
+        'db.get': lambda: scratch.get('products.json', rows[-1]['id']),
+        'db.insert': insert,
+        'db.update': update
+    }
+
+    # Từng định dạng file, mỗi định dạng một bảng riêng
+    default_codec = scratch.codec
+    def with_codec(codec, fn):
+        def run():
+            scratch.codec = codec
+            try:
+                fn()
+            finally:
+                scratch.codec = default_codec
+        return run
+
+    for name, codec in CODECS.items():
+        table = f'products_{name}.json'
+        with_codec(codec, lambda: scratch.save(table, rows))()
+        scenarios[f'db.save_{name}'] = with_codec(codec, lambda table=table: scratch.save(table, rows))
+        scenarios[f'db.load_cold_{name}'] = lambda table=table: (scratch.invalidate(table), scratch.load(table))
+    return scenarios
+
+# ==================== SO SÁNH VỚI BASELINE ====================
+
+def compare(results, baseline, threshold):
+    """In bảng so sánh median với baseline; trả về danh sách benchmark chậm đi quá threshold"""
+    # Đơn hàng/giỏ hàng tăng dần sau mỗi lần đo nên chỉ so quy mô danh mục và người dùng
+    scale = lambda meta: {table: meta.get('rows', {}).get(table) for table in ('products.json', 'users.json')}
+    if scale(baseline['meta']) != scale(results['meta']):
+        print("⚠️  Baseline được đo trên dữ liệu khác quy mô, kết quả chỉ mang tính tham khảo")
+
+    regressions = []
+    print(f"{'benchmark':<20} {'baseline':>12} {'hiện tại':>12} {'tỉ lệ':>8}")
+    for name, result in sorted(results['results'].items()):
+        base = baseline['results'].get(name)
+        if not base:
+            print(f"{name:<20} {'-':>12} {result['median_ms']:>10.2f}ms {'mới':>8}")
+            continue
+        ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] else 1.0
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = ' ❌ chậm hơn'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            mark = ' ✅ nhanh hơn'
+        print(f"{name:<20} {base['median_ms']:>10.2f}ms {result['median_ms']:>10.2f}ms {ratio:>7.2f}x{mark}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Đo hiệu năng các luồng chính và SimpleDB')
+    parser.add_argument('--data-dir', help='thư mục dữ liệu dùng để đo (mặc định: thư mục tạm, '
+                                           'chép từ dữ liệu hiện tại nếu không --generate)')
+    parser.add_argument('--backend', choices=['json', 'sqlite'])
+    parser.add_argument('--generate', type=int, metavar='SCALE', help='sinh dữ liệu giả quy mô SCALE trước khi đo')
+    parser.add_argument('--force', action='store_true', help='cho phép --generate ghi đè thư mục dữ liệu thật')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--only', help='chỉ chạy benchmark có tên chứa chuỗi này')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='file kết quả cũ để so sánh')
+    parser.add_argument('--save-baseline', action='store_true', help='ghi kết quả lần này thành baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='mức chậm đi (tỉ lệ) bị coi là regression')
+    args = parser.parse_args()
+
+    # Benchmark đặt hàng, sửa giỏ hàng... nên mặc định chạy trên thư mục tạm, không đụng data/ thật
+    live_dir = Config.DATA_DIR
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='bench-data-')
+    if args.generate and os.path.realpath(data_dir) == os.path.realpath(live_dir) and not args.force:
+        print(f"❌ --generate sẽ ghi đè dữ liệu thật trong {live_dir}: chọn --data-dir khác hoặc thêm --force")
+        sys.exit(1)
+    if not args.data_dir and not args.generate:
+        # Đo trên bản sao của dữ liệu hiện tại (kể cả SQLite nếu nằm ngoài thư mục dữ liệu)
+        shutil.copytree(live_dir, data_dir, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns('.lock', '*-shm', 'profiles'))
+        if os.path.exists(Config.SQLITE_PATH) and not os.path.exists(os.path.join(data_dir, 'store.db')):
+            for suffix in ('', '-wal'):
+                if os.path.exists(Config.SQLITE_PATH + suffix):
+                    shutil.copyfile(Config.SQLITE_PATH + suffix, os.path.join(data_dir, 'store.db' + suffix))
+    Config.DATA_DIR = data_dir
+    Config.SQLITE_PATH = os.path.join(data_dir, 'store.db')
+    print(f"📦 Dữ liệu đo: {data_dir}")
+    if args.backend:
+        Config.DB_BACKEND = args.backend
+    if args.generate:
+        from generate_data import generate
+        generate(args.generate, args.seed)
+
+    # app tạo db theo Config lúc import nên phải import sau khi đã chỉnh Config
+    import app as web
+
+    rng = random.Random(args.seed)
+    scratch_dir = tempfile.mkdtemp(prefix='bench-')
+    results = {
+        'meta': {
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': Config.DB_BACKEND,
+            'rows': {table: len(web.db.load(table)) for table in TABLES}
+        },
+        'results': {}
+    }
+    try:
+        scenarios = dict(web_scenarios(web, rng))
+        scenarios.update(db_scenarios(web.db.load('products.json'), scratch_dir))
+        for name, fn in scenarios.items():
+            if args.only and args.only not in name:
+                continue
+            # bcrypt cố ý chậm nên đăng nhập chỉ đo vài lần
+            iterations = min(args.iterations, 5) if name == 'web.login' else args.iterations
+            results['results'][name] = measure(fn, iterations)
+            print(f"⏱  {name:<20} median {results['results'][name]['median_ms']:.2f}ms")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        if not args.data_dir:
+            web.job_queue.stop()
+            web.inventory.stop()
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"📄 Kết quả: {args.output}")
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    if args.baseline and args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"📌 Đã lưu baseline: {args.baseline}")
+
+    if regressions:
+        print(f"❌ Chậm hơn baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
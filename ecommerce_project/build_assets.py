@@ -0,0 +1,125 @@
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+from config import Config
+from utils.assets import MANIFEST_FILE
+
+try:
+    from PIL import Image
+except ImportError:
+    # Không có Pillow thì chỉ fingerprint ảnh gốc, không tạo ảnh thu nhỏ/WebP
+    Image = None
+
+try:
+    import brotli
+except ImportError:
+    # Không có brotli thì chỉ nén sẵn gzip
+    brotli = None
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+TEXT_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt')
+
+def fingerprint(relpath, data, extension=None):
+    """images/15-pro.jpg -> images/15-pro.<hash>.jpg (hash theo nội dung)"""
+    stem, ext = os.path.splitext(relpath)
+    digest = hashlib.sha1(data).hexdigest()[:10]
+    return f'{stem}.{digest}{extension or ext}'
+
+def write_file(out_dir, relpath, data):
+    path = os.path.join(out_dir, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Tên có fingerprint nên file đã có chắc chắn cùng nội dung
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    return path
+
+def image_variants(source, relpath, out_dir, quality):
+    """Ảnh thu nhỏ theo Config.IMAGE_VARIANTS, mỗi cỡ một bản JPEG và một bản WebP"""
+    variants = {}
+    with Image.open(source) as original:
+        original = original.convert('RGB')
+        for variant, width in Config.IMAGE_VARIANTS.items():
+            image = original.copy()
+            # Không phóng to ảnh nhỏ hơn kích thước yêu cầu
+            image.thumbnail((width, width * 4), Image.LANCZOS)
+            stem = os.path.splitext(relpath)[0] + f'-{variant}'
+            files = {}
+            for key, fmt, ext in (('jpeg', 'JPEG', '.jpg'), ('webp', 'WEBP', '.webp')):
+                buffer = io.BytesIO()
+                image.save(buffer, fmt, quality=quality, optimize=True, **({'method': 6} if fmt == 'WEBP' else {}))
+                data = buffer.getvalue()
+                files[key] = fingerprint(stem + ext, data)
+                write_file(out_dir, files[key], data)
+            variants[variant] = dict(files, width=image.width, height=image.height)
+    return variants
+
+def compress_text(path, data):
+    """Bản nén sẵn .gz (và .br nếu có brotli) nằm cạnh file đã fingerprint"""
+    if not os.path.exists(path + '.gz'):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None and not os.path.exists(path + '.br'):
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+
+def build(static_dir, out_dir, quality=80, clean=False):
+    """Build mọi file trong static_dir (trừ thư mục build) vào out_dir và ghi manifest.json"""
+    if clean and os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != os.path.normpath(out_dir))
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relpath = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            ext = os.path.splitext(name)[1].lower()
+            if ext not in IMAGE_EXTENSIONS + TEXT_EXTENSIONS:
+                continue
+
+            with open(source, 'rb') as f:
+                data = f.read()
+            entry = {'url': fingerprint(relpath, data)}
+            path = write_file(out_dir, entry['url'], data)
+
+            if ext in TEXT_EXTENSIONS:
+                compress_text(path, data)
+            elif Image is not None:
+                entry['variants'] = image_variants(source, relpath, out_dir, quality)
+            manifest[relpath] = entry
+
+            sizes = ', '.join(f"{variant} {os.path.getsize(os.path.join(out_dir, files['webp'])):,}B"
+                              for variant, files in entry.get('variants', {}).items())
+            print(f"✅ {relpath}: {len(data):,}B" + (f" -> {sizes} (webp)" if sizes else ''))
+
+    # Ghi manifest sau cùng và thay nguyên tử: server đang chạy không thấy manifest trỏ tới file chưa có
+    tmp_path = os.path.join(out_dir, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST_FILE))
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description='Build file tĩnh: fingerprint, ảnh thu nhỏ/WebP, nén sẵn gzip/brotli')
+    parser.add_argument('--static-dir', default='static')
+    parser.add_argument('--out-dir', default=Config.ASSETS_DIR)
+    parser.add_argument('--quality', type=int, default=80, help='chất lượng JPEG/WebP (1-100)')
+    parser.add_argument('--clean', action='store_true',
+                        help='xóa bản build cũ trước (trang đang được cache có thể còn trỏ tới file cũ)')
+    args = parser.parse_args()
+
+    if Image is None:
+        print("⚠️  Chưa cài Pillow (pip install Pillow): chỉ fingerprint ảnh gốc, không tạo ảnh thu nhỏ/WebP")
+    if brotli is None:
+        print("⚠️  Chưa cài brotli (pip install brotli): file text chỉ được nén sẵn gzip")
+    manifest = build(args.static_dir, args.out_dir, args.quality, args.clean)
+    print(f"📦 {len(manifest)} file -> {args.out_dir}")
+
+if __name__ == '__main__':
+    main()
@@ -2,4 +2,110 @@ import os
 
 class Config:
     SECRET_KEY = 'ecommerce-secret-key-2024'
-    DATA_DIR = 'data'
\ No newline at end of file
+    DATA_DIR = 'data'
+    
+    # 'json': các file data/*.json (SimpleDB), 'sqlite': SQLiteDB trong SQLITE_PATH
+    # Chuyển dữ liệu giữa hai backend bằng: python migrate_db.py import|export
+    DB_BACKEND = 'json'
+    SQLITE_PATH = os.path.join(DATA_DIR, 'store.db')
+    
+    # Giữ các bảng JSON đã parse trong bộ nhớ, tự nạp lại khi file thay đổi
+    DB_CACHE = True
+    
+    # 'log': mỗi thay đổi được ghi thêm vào data/<bảng>.log rồi gộp dần vào snapshot
+    # 'snapshot': ghi lại toàn bộ file JSON như trước
+    DB_WRITE_MODE = 'log'
+    DB_LOG_MAX_BYTES = 256 * 1024
+    
+    # Định dạng file bảng: 'compact' (mảng JSON không thụt lề), 'pretty' (thụt lề 2 như trước),
+    # 'jsonl' (mỗi bản ghi một dòng, đọc lười được); đổi định dạng dữ liệu cũ bằng convert_db.py
+    DB_CODEC = 'compact'
+    # Bảng lưu dạng RecordStore (mmap, slot cố định + index trong file): đọc một bản ghi
+    # không cần giải mã cả bảng, hợp với bảng lớn như ['orders.json', 'order_items.json']
+    DB_MAPPED_TABLES = []
+    # Dùng orjson để đọc/ghi JSON nếu đã cài
+    DB_FAST_JSON = True
+    
+    # fsync khi commit giao dịch (db.transaction) để chịu được mất điện
+    DB_FSYNC = True
+    
+    # Cost của bcrypt; hash cũ có cost khác được băm lại ở lần đăng nhập kế tiếp
+    AUTH_BCRYPT_ROUNDS = 12
+    # Số thread băm mật khẩu và số việc được chờ thêm; vượt quá thì trả 503
+    AUTH_WORKERS = 4
+    AUTH_QUEUE_LIMIT = 16
+    AUTH_RETRY_AFTER = 2
+    
+    # Đo thời gian theo route, số lần load/save, byte đọc/ghi, thời gian parse JSON/bcrypt/render;
+    # xem ở /admin/metrics (đăng nhập admin hoặc header Authorization: Bearer <METRICS_TOKEN>)
+    METRICS_ENABLED = False
+    METRICS_TOKEN = None
+    # Gửi header Server-Timing (thời gian DB/JSON/bcrypt/render) cho admin và request có METRICS_TOKEN
+    METRICS_SERVER_TIMING = True
+    # Tỉ lệ request được chạy cProfile (0 = tắt); chỉ giữ file .prof của PROFILE_KEEP request chậm nhất
+    PROFILE_SAMPLE_RATE = 0.0
+    PROFILE_DIR = os.path.join(DATA_DIR, 'profiles')
+    PROFILE_KEEP = 20
+    
+    # Số sản phẩm mỗi trang ở trang chủ, /products và /admin/products
+    PAGE_SIZE = 24
+    
+    # File tĩnh đã build bằng build_assets.py (tên có fingerprint, ảnh thu nhỏ/WebP, bản nén sẵn gzip/brotli),
+    # phục vụ ở ASSETS_URL với cache dài hạn; chưa build thì dùng thẳng static/ như cũ
+    ASSETS_DIR = os.path.join('static', 'build')
+    ASSETS_URL = '/assets/'
+    ASSETS_MAX_AGE = 365 * 24 * 3600
+    # Chiều rộng tối đa (px) từng cỡ ảnh sản phẩm: mini (giỏ hàng, quản trị), thumb (thẻ sản phẩm), detail
+    IMAGE_VARIANTS = {'mini': 160, 'thumb': 400, 'detail': 900}
+    
+    # Nén gzip/brotli response HTML/JSON/CSV khi client hỗ trợ (brotli cần pip install brotli);
+    # response ngắn hơn COMPRESS_MIN_SIZE byte không đáng nén, response stream luôn được nén
+    COMPRESS_ENABLED = False
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_MIMETYPES = ['text/html', 'text/plain', 'text/css', 'text/csv', 'application/json',
+                          'application/x-ndjson', 'application/javascript', 'image/svg+xml']
+    # Trang render dạng stream được gom thành từng đoạn khoảng chừng này byte trước khi gửi
+    STREAM_CHUNK_SIZE = 8 * 1024
+    
+    # Cache trang/fragment đã render của trang chủ, /products, /product/<id> theo phiên bản danh mục;
+    # các trang này luôn có ETag (If-None-Match trả 304 mà không render)
+    PAGE_CACHE_ENABLED = True
+    PAGE_CACHE_SIZE = 500
+    
+    # Hàng đợi việc chạy sau khi đặt hàng (dọn giỏ hàng, làm mới danh mục...), lưu trong bảng jobs.json của DB.
+    # JOB_WORKERS thread trong mỗi process web; 0 = không chạy trong web, dùng python run_jobs.py
+    JOB_WORKERS = 2
+    # Worker tự kiểm tra việc mới (của process khác) sau mỗi chừng này giây
+    JOB_POLL_INTERVAL = 1.0
+    # Việc lỗi được thử lại sau JOB_RETRY_DELAY, 2x, 4x... giây; quá JOB_MAX_ATTEMPTS lần thì
+    # được chuyển sang bảng jobs_failed.json (việc xong thì bị xóa khỏi jobs.json)
+    JOB_MAX_ATTEMPTS = 5
+    JOB_RETRY_DELAY = 5
+    # Chỉ giữ chừng này việc lỗi gần nhất trong jobs_failed.json
+    JOB_KEEP_FAILED = 1000
+    # Việc có key đã xong thì enqueue cùng key trong JOB_KEY_TTL giây bị bỏ qua (0 = chỉ chặn khi còn trong hàng đợi)
+    JOB_KEY_TTL = 10 * 60
+    # Việc đang chạy quá JOB_TIMEOUT giây (process chết) thì được chạy lại
+    JOB_TIMEOUT = 60
+    
+    # Thêm vào giỏ là giữ hàng cho giỏ trong RESERVATION_TTL giây (gia hạn mỗi lần sửa số lượng);
+    # lượt giữ hết hạn được bỏ sau mỗi RESERVATION_SWEEP_INTERVAL giây
+    RESERVATION_TTL = 15 * 60
+    RESERVATION_SWEEP_INTERVAL = 5
+    # Tồn kho giảm sau mỗi đơn hàng: cache trang danh mục chỉ bị làm mới tối đa một lần mỗi chừng này giây
+    # (sản phẩm hết hàng thì làm mới ngay); 0 = làm mới sau mỗi đơn
+    CATALOG_REFRESH_INTERVAL = 10
+    
+    # serve.py: gunicorn với SERVER_WORKERS process (None = số CPU), mỗi process SERVER_THREADS thread.
+    # Mỗi worker có cache trang và số đo /admin/metrics riêng
+    SERVER_HOST = '0.0.0.0'
+    SERVER_PORT = 5000
+    SERVER_WORKERS = None
+    SERVER_THREADS = 8
+    # Worker không phản hồi quá SERVER_TIMEOUT giây thì bị khởi động lại;
+    # khi tắt (SIGTERM) request đang chạy có tối đa SERVER_GRACEFUL_TIMEOUT giây để xong
+    SERVER_TIMEOUT = 30
+    SERVER_GRACEFUL_TIMEOUT = 30
+    SERVER_KEEPALIVE = 5
@@ -0,0 +1,40 @@
+import argparse
+import os
+from config import Config
+from utils.db import SimpleDB, CODECS
+
+def convert(codec_name):
+    """Ghi lại mọi bảng data/*.json theo định dạng mới (log được gộp vào luôn).
+
+    Bảng trong Config.DB_MAPPED_TABLES được ghi dạng RecordStore thay vì codec.
+    """
+    db = SimpleDB()
+    db.codec = CODECS[codec_name]
+    for name in sorted(os.listdir(db.data_dir)):
+        if not name.endswith('.json') or name.startswith('_'):
+            continue
+        before = os.path.getsize(db._path(name))
+        db.save(name, db.load(name))
+        after = os.path.getsize(db._path(name))
+        print(f"✅ {name}: {before:,} -> {after:,} byte")
+
+def main():
+    parser = argparse.ArgumentParser(description='Đổi định dạng file dữ liệu JSON')
+    parser.add_argument('codec', choices=sorted(CODECS), help='định dạng đích')
+    parser.add_argument('--map', nargs='*', metavar='TABLE',
+                        help='các bảng ghi dạng RecordStore (mmap), mặc định theo Config.DB_MAPPED_TABLES')
+    parser.add_argument('--data-dir', help=f'thư mục dữ liệu (mặc định {Config.DATA_DIR})')
+    args = parser.parse_args()
+
+    configured = list(Config.DB_MAPPED_TABLES)
+    if args.data_dir:
+        Config.DATA_DIR = args.data_dir
+    if args.map is not None:
+        Config.DB_MAPPED_TABLES = args.map
+    convert(args.codec)
+    if args.codec != Config.DB_CODEC or sorted(Config.DB_MAPPED_TABLES) != sorted(configured):
+        print(f"⚠️  Config đang là DB_CODEC='{Config.DB_CODEC}', DB_MAPPED_TABLES={configured}: "
+              f"lần ghi kế tiếp của mỗi bảng sẽ dùng lại định dạng đó")
+
+if __name__ == '__main__':
+    main()
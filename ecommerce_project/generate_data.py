@@ -0,0 +1,157 @@
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+from config import Config
+
+BRANDS = ['Apple', 'Samsung', 'Xiaomi', 'Dell', 'Sony', 'Asus', 'Lenovo', 'Oppo', 'Vivo', 'HP']
+KINDS = ['Điện thoại', 'Laptop', 'Máy tính bảng', 'Tai nghe', 'Đồng hồ', 'Loa', 'Màn hình', 'Bàn phím']
+WORDS = ['Pro', 'Max', 'Ultra', 'Plus', 'Lite', 'Mini', 'Air', 'Neo', 'Gaming', 'Slim']
+FEATURES = ['chống nước', 'sạc nhanh', 'màn hình OLED', 'pin trâu', 'camera 200MP', 'chip AI',
+            'bảo hành 24 tháng', 'kết nối 5G', 'âm thanh vòm', 'siêu mỏng nhẹ']
+IMAGES = ['15-pro.jpg', 'airpods-pro-2nd.jpg', 'apple-watch-s9.jpg', 'dell-xps-13-plus.jpg', 'ipad-pro-M4.jpg',
+          'macbookair-M3.jpg', 'samsung-galaxy-tab-s9.jpg', 'samsungs24-ultra.jpg', 'sony-playstation-5.jpg',
+          'xiaomi-redmi-note-13.jpg']
+STATUSES = ['pending'] * 3 + ['completed'] * 6 + ['cancelled']
+
+def sizes_for(scale):
+    """Số bản ghi mỗi bảng theo quy mô (1k ... 1M)"""
+    return {
+        'products': scale,
+        'users': scale,
+        'orders': scale,
+        'carts': max(scale // 10, 1)
+    }
+
+def make_categories():
+    categories = []
+    for kind in KINDS:
+        root = {'id': len(categories) + 1, 'name': kind, 'parent_id': None}
+        categories.append(root)
+        for brand in BRANDS:
+            categories.append({'id': len(categories) + 1, 'name': f'{kind} {brand}', 'parent_id': root['id']})
+    return categories
+
+def make_products(rng, count, categories):
+    leaves = [c for c in categories if c['parent_id'] is not None]
+    products = []
+    for product_id in range(1, count + 1):
+        category = rng.choice(leaves)
+        name = f"{category['name']} {rng.choice(WORDS)} {rng.randint(1, 99)}"
+        products.append({
+            'id': product_id,
+            'name': name,
+            'price': rng.randint(10, 5000) * 10000,
+            'stock': rng.randint(100, 100000),
+            'category_id': category['id'],
+            'description': f"{name} - {', '.join(rng.sample(FEATURES, 3))}",
+            'image': f'/static/images/{rng.choice(IMAGES)}'
+        })
+    return products
+
+def make_users(count, password_hashes):
+    # Hai tài khoản demo giữ nguyên như init_data.py; mọi user sinh ra dùng chung một hash
+    users = [
+        {'id': 1, 'name': 'Admin', 'email': 'admin@example.com',
+         'password_hash': password_hashes['admin123'], 'role': 'admin'},
+        {'id': 2, 'name': 'Demo User', 'email': 'user@example.com',
+         'password_hash': password_hashes['user123'], 'role': 'user'}
+    ]
+    for user_id in range(3, count + 3):
+        users.append({'id': user_id, 'name': f'Khách hàng {user_id}', 'email': f'user{user_id}@example.com',
+                      'password_hash': password_hashes['password123'], 'role': 'user'})
+    return users
+
+def make_orders(rng, count, users, products, days=365):
+    orders = []
+    order_items = []
+    now = datetime.now()
+    for order_id in range(1, count + 1):
+        user = users[rng.randrange(1, len(users))]
+        created_at = now - timedelta(seconds=rng.randrange(days * 86400))
+        total = 0
+        for product in rng.sample(products, min(rng.randint(1, 4), len(products))):
+            quantity = rng.randint(1, 3)
+            total += product['price'] * quantity
+            order_items.append({'id': len(order_items) + 1, 'order_id': order_id, 'product_id': product['id'],
+                                'quantity': quantity, 'price': product['price']})
+        orders.append({'id': order_id, 'user_id': user['id'], 'total': total, 'status': rng.choice(STATUSES),
+                       'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S')})
+    # Lịch sử đơn hàng được ghi theo thời gian nên id tăng cùng created_at
+    orders.sort(key=lambda o: o['created_at'])
+    renumber = {order['id']: new_id for new_id, order in enumerate(orders, 1)}
+    for order in orders:
+        order['id'] = renumber[order['id']]
+    for item in order_items:
+        item['order_id'] = renumber[item['order_id']]
+    order_items.sort(key=lambda i: (i['order_id'], i['id']))
+    for item_id, item in enumerate(order_items, 1):
+        item['id'] = item_id
+    return orders, order_items
+
+def make_carts(rng, count, users, products):
+    carts = []
+    cart_items = []
+    for cart_id, user in enumerate(rng.sample(users[1:], min(count, len(users) - 1)), 1):
+        carts.append({'id': cart_id, 'user_id': user['id'], 'active': True})
+        for product in rng.sample(products, min(rng.randint(1, 5), len(products))):
+            cart_items.append({'id': len(cart_items) + 1, 'cart_id': cart_id, 'product_id': product['id'],
+                               'quantity': rng.randint(1, 3)})
+    return carts, cart_items
+
+def generate(scale=1000, seed=42, **overrides):
+    """Sinh dữ liệu giả cùng schema với init_data.py vào Config.DATA_DIR / SQLite hiện tại"""
+    from utils.auth import SimpleAuth
+    from utils.db import open_db
+    from utils.stats import DashboardStats
+    from utils.page_cache import CatalogVersion
+
+    sizes = dict(sizes_for(scale), **{k: v for k, v in overrides.items() if v is not None})
+    rng = random.Random(seed)
+    auth = SimpleAuth()
+    password_hashes = {password: auth.hash_password(password) for password in ('admin123', 'user123', 'password123')}
+
+    categories = make_categories()
+    products = make_products(rng, sizes['products'], categories)
+    users = make_users(sizes['users'], password_hashes)
+    orders, order_items = make_orders(rng, sizes['orders'], users, products)
+    carts, cart_items = make_carts(rng, sizes['carts'], users, products)
+
+    db = open_db()
+    tables = [('categories.json', categories), ('products.json', products), ('users.json', users),
+              ('orders.json', orders), ('order_items.json', order_items),
+              ('carts.json', carts), ('cart_items.json', cart_items),
+              # Lượt giữ hàng và việc nền của dữ liệu cũ không còn đúng với dữ liệu mới
+              ('inventory.json', []), ('reservations.json', []), ('jobs.json', []), ('jobs_failed.json', []),
+              ('job_keys.json', [])]
+    for filename, rows in tables:
+        db.save(filename, rows)
+        print(f"✅ {filename}: {len(rows)} bản ghi")
+    DashboardStats(db).rebuild()
+    CatalogVersion(db).bump()
+    return {filename: len(rows) for filename, rows in tables}
+
+def main():
+    parser = argparse.ArgumentParser(description='Sinh dữ liệu giả quy mô lớn để đo hiệu năng')
+    parser.add_argument('--scale', type=int, default=1000, help='số bản ghi cơ sở (1000 ... 1000000)')
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--orders', type=int)
+    parser.add_argument('--carts', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help=f'thư mục dữ liệu (mặc định {Config.DATA_DIR})')
+    parser.add_argument('--backend', choices=['json', 'sqlite'])
+    args = parser.parse_args()
+
+    if args.data_dir:
+        Config.DATA_DIR = args.data_dir
+        Config.SQLITE_PATH = os.path.join(args.data_dir, 'store.db')
+    if args.backend:
+        Config.DB_BACKEND = args.backend
+
+    generate(args.scale, args.seed, products=args.products, users=args.users,
+             orders=args.orders, carts=args.carts)
+    print(f"📦 Dữ liệu: {Config.DATA_DIR} ({Config.DB_BACKEND})")
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,10 @@
-from utils.db import SimpleDB
+from utils.db import open_db
 from utils.auth import SimpleAuth
+from utils.stats import DashboardStats
+from utils.page_cache import CatalogVersion
 
 def init_sample_data():
-    db = SimpleDB()
+    db = open_db()
     
     # Categories - Thêm đầy đủ danh mục
     categories = [
@@ -136,6 +138,17 @@ def init_sample_data():
     db.save('carts.json', [])
     db.save('orders.json', [])
     db.save('order_items.json', [])
+    # Lượt giữ hàng và việc nền của dữ liệu cũ không còn đúng với dữ liệu mới
+    db.save('inventory.json', [])
+    db.save('reservations.json', [])
+    db.save('jobs.json', [])
+    db.save('jobs_failed.json', [])
+    db.save('job_keys.json', [])
+
+    # Số liệu bảng điều khiển tính từ dữ liệu vừa tạo
+    DashboardStats(db).rebuild()
+    # Phiên bản danh mục mới để trang/ETag cũ không còn được dùng
+    CatalogVersion(db).bump()
 
     print("✅ Dữ liệu mẫu đã được khởi tạo!")
     print("📦 Đã thêm 10 sản phẩm với đầy đủ hình ảnh")
@@ -0,0 +1,48 @@
+import os
+import sys
+from config import Config
+from utils.db import SimpleDB
+from utils.sqlite_db import SQLiteDB, SCHEMAS
+
+def json_tables():
+    tables = set(SCHEMAS)
+    for name in os.listdir(Config.DATA_DIR):
+        if name.endswith('.json') and not name.startswith('_'):
+            tables.add(name)
+    return sorted(tables)
+
+def import_json():
+    """Nạp toàn bộ data/*.json vào SQLite"""
+    json_db = SimpleDB()
+    json_db.compact()
+    sql_db = SQLiteDB()
+    with sql_db.transaction():
+        for table in json_tables():
+            rows = json_db.load(table)
+            sql_db.save(table, rows)
+            print(f"✅ {table}: {len(rows)} bản ghi")
+
+def export_json():
+    """Xuất các bảng SQLite ngược lại thành data/*.json"""
+    json_db = SimpleDB()
+    sql_db = SQLiteDB()
+    for table in sql_db.tables():
+        rows = sql_db.load(table)
+        json_db.save(table, rows)
+        print(f"✅ {table}: {len(rows)} bản ghi")
+
+def main():
+    if len(sys.argv) != 2 or sys.argv[1] not in ('import', 'export'):
+        print("Cách dùng: python migrate_db.py import|export")
+        print("   import: data/*.json -> SQLite")
+        print("   export: SQLite -> data/*.json")
+        sys.exit(1)
+
+    if sys.argv[1] == 'import':
+        import_json()
+    else:
+        export_json()
+    print(f"📦 SQLite: {Config.SQLITE_PATH}")
+
+if __name__ == '__main__':
+    main()
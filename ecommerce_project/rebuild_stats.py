@@ -0,0 +1,13 @@
+from utils.db import open_db
+from utils.stats import DashboardStats
+
+def rebuild_stats():
+    """Tính lại số liệu bảng điều khiển từ dữ liệu gốc (sau khi sửa dữ liệu bằng tay, import...)"""
+    stats = DashboardStats(open_db()).rebuild()
+    print(f"✅ Đơn hàng: {stats['total_orders']}, doanh thu: {stats['total_revenue']:,}")
+    print(f"✅ Sản phẩm: {stats['total_products']}, người dùng: {stats['total_users']}")
+    for status, count in sorted(stats['status_counts'].items()):
+        print(f"   {status}: {count}")
+
+if __name__ == '__main__':
+    rebuild_stats()
@@ -0,0 +1,33 @@
+import argparse
+import signal
+import time
+from config import Config
+
+def main():
+    parser = argparse.ArgumentParser(description='Chạy worker hàng đợi việc nền trong một process riêng')
+    parser.add_argument('--workers', type=int, default=max(Config.JOB_WORKERS, 1))
+    parser.add_argument('--once', action='store_true', help='chạy hết việc đến hạn rồi thoát')
+    args = parser.parse_args()
+
+    # Import sau khi đọc tham số: app đăng ký handler cho từng loại việc
+    from app import job_queue
+
+    if args.once:
+        count = job_queue.run_pending()
+        print(f"✅ Đã chạy {count} việc")
+        return
+
+    print(f"🔄 {args.workers} worker đang chạy (Ctrl+C để dừng)")
+    job_queue.start(args.workers)
+    # SIGTERM cũng dừng như Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n🛑 Đang dừng, chờ việc đang chạy xong...")
+    finally:
+        job_queue.stop()
+
+if __name__ == '__main__':
+    main()
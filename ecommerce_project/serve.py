@@ -0,0 +1,101 @@
+# serve.py
+import argparse
+import gc
+import os
+import signal
+import sys
+from config import Config
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    # gunicorn không chạy được trên Windows: dùng server đa luồng của Werkzeug (một process)
+    BaseApplication = None
+
+def load_app():
+    """Import app, nạp sẵn dữ liệu rồi đóng băng heap trước khi fork"""
+    from app import app, warm_up
+    app.debug = False
+    app.jinja_env.auto_reload = False
+    warm_up()
+    # Các object đã nạp được chuyển sang thế hệ cố định: GC ở worker không ghi vào
+    # header của chúng nên các trang bộ nhớ vẫn dùng chung với process chính
+    gc.collect()
+    gc.freeze()
+    return app
+
+if BaseApplication is not None:
+    class ProductionServer(BaseApplication):
+        """gunicorn chạy trong process này, cấu hình lấy từ Config thay cho file cấu hình riêng"""
+
+        def __init__(self, options):
+            self.options = options
+            self.application = None
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # preload_app: gọi một lần trong process chính, trước khi fork các worker
+            if self.application is None:
+                self.application = load_app()
+            return self.application
+
+def run_gunicorn(args):
+    options = {
+        'bind': f'{args.host}:{args.port}',
+        'workers': args.workers,
+        # gthread: mỗi worker một thread pool, request chờ I/O không chặn cả process
+        'worker_class': 'gthread',
+        'threads': args.threads,
+        'preload_app': True,
+        'timeout': Config.SERVER_TIMEOUT,
+        'graceful_timeout': Config.SERVER_GRACEFUL_TIMEOUT,
+        'keepalive': Config.SERVER_KEEPALIVE,
+        'accesslog': '-' if args.access_log else None,
+    }
+    # SIGTERM: ngừng nhận kết nối mới, chờ request đang chạy xong rồi mới thoát
+    ProductionServer(options).run()
+
+def run_werkzeug(args):
+    from werkzeug.serving import make_server
+    app = load_app()
+    server = make_server(args.host, args.port, app, threaded=True)
+    # Khi tắt, server_close() chờ các thread request đang chạy xong
+    server.daemon_threads = False
+
+    def stop(signum, frame):
+        print("\n🛑 Đang dừng, chờ các request đang chạy...")
+        raise KeyboardInterrupt
+    # Ctrl+C và SIGTERM đều dừng vòng phục vụ; serve_forever tự gọi server_close()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f"🌐 Đang phục vụ tại http://{args.host}:{args.port} (Ctrl+C để dừng)")
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Chạy ứng dụng ở chế độ production (không debug, không reloader)')
+    parser.add_argument('--host', default=Config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=Config.SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS or os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=Config.SERVER_THREADS)
+    parser.add_argument('--access-log', action='store_true', help='ghi access log ra stdout')
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(Config.DATA_DIR, 'products.json')) and Config.DB_BACKEND == 'json':
+        print("❌ Chưa có dữ liệu, chạy trước: python init_data.py")
+        sys.exit(1)
+
+    if BaseApplication is None:
+        print("⚠️  Chưa cài gunicorn (pip install gunicorn, không hỗ trợ Windows): "
+              "chạy server đa luồng một process")
+        run_werkzeug(args)
+    else:
+        print(f"🚀 gunicorn: {args.workers} worker x {args.threads} thread tại {args.host}:{args.port}")
+        run_gunicorn(args)
+
+if __name__ == '__main__':
+    main()
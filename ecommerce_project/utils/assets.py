@@ -0,0 +1,118 @@
+import json
+import mimetypes
+import os
+import threading
+from datetime import datetime, timezone
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+MANIFEST_FILE = 'manifest.json'
+STATIC_PREFIX = '/static/'
+
+# File đã nén sẵn: phần mở rộng theo Content-Encoding, ưu tiên theo thứ tự
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+class Assets:
+    """Tra manifest do build_assets.py tạo để lấy URL có fingerprint và phục vụ file đã build.
+
+    Chưa build (không có manifest) thì mọi URL giữ nguyên như cũ (/static/...).
+    """
+
+    def __init__(self, build_dir, url_prefix, max_age):
+        self.build_dir = build_dir
+        self.url_prefix = url_prefix
+        self.max_age = max_age
+        self._manifest = {}
+        self._files = frozenset()
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def manifest(self):
+        # Build lại trong lúc server đang chạy thì manifest mới được nạp ở request kế tiếp
+        path = os.path.join(self.build_dir, MANIFEST_FILE)
+        try:
+            stamp = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            stamp = None
+        if stamp != self._stamp:
+            with self._lock:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        manifest = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    manifest = {}
+                self._files = self._fingerprinted(manifest)
+                self._manifest = manifest
+                self._stamp = stamp
+        return self._manifest
+
+    def _fingerprinted(self, manifest):
+        """Tên các file có fingerprint trong manifest: chỉ những file này được phục vụ"""
+        files = set()
+        for entry in manifest.values():
+            files.add(entry['url'])
+            for image in entry.get('variants', {}).values():
+                files.update(image[kind] for kind in ('jpeg', 'webp') if image.get(kind))
+        return frozenset(files)
+
+    def version(self):
+        """Đổi sau mỗi lần build, dùng chung với phiên bản danh mục cho cache trang"""
+        self.manifest()
+        return self._stamp
+
+    def modified(self):
+        stamp = self.version()
+        return datetime.fromtimestamp(stamp // 10 ** 9 if stamp else 0, timezone.utc)
+
+    def _entry(self, src):
+        if not src or not src.startswith(STATIC_PREFIX):
+            return None
+        return self.manifest().get(src[len(STATIC_PREFIX):])
+
+    def url(self, src):
+        """URL có fingerprint của file trong static/, hoặc src nếu chưa build"""
+        entry = self._entry(src)
+        return self.url_prefix + entry['url'] if entry else src
+
+    def image(self, src, variant):
+        """Ảnh đã thu nhỏ theo variant (thumb, detail...): src (JPEG), webp, width, height"""
+        entry = self._entry(src)
+        image = entry and entry.get('variants', {}).get(variant)
+        if not image:
+            return {'src': self.url(src), 'webp': None, 'width': None, 'height': None}
+        return {
+            'src': self.url_prefix + image['jpeg'],
+            'webp': self.url_prefix + image['webp'] if image.get('webp') else None,
+            'width': image['width'],
+            'height': image['height']
+        }
+
+    def send(self, filename):
+        """Phục vụ file đã build với cache dài hạn; file text dùng bản nén sẵn nếu client nhận.
+
+        Chỉ file có tên trong manifest (đã có fingerprint) được phục vụ: manifest.json
+        hay file không fingerprint mà bị cache immutable thì trình duyệt/CDN giữ bản cũ mãi.
+        """
+        self.manifest()
+        if filename not in self._files:
+            return None
+        path = safe_join(self.build_dir, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+
+        encoding = None
+        for name, suffix in ENCODINGS:
+            if request.accept_encodings[name] and os.path.isfile(path + suffix):
+                encoding, filename = name, filename + suffix
+                break
+
+        # Tên file đã có fingerprint nên nội dung không bao giờ đổi
+        response = send_from_directory(self.build_dir, filename, max_age=self.max_age,
+                                       mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if any(os.path.isfile(path + suffix) for _, suffix in ENCODINGS):
+            response.vary.add('Accept-Encoding')
+        return response
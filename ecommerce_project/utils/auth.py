@@ -1,10 +1,70 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
+from config import Config
+
+class AuthBusyError(Exception):
+    """Hàng đợi băm mật khẩu đã đầy; route nên trả 503 để client thử lại sau"""
+    pass
+
+class AuthExecutor:
+    """Thread pool có giới hạn cho bcrypt.
+
+    bcrypt nhả GIL nên các worker chạy song song thật, còn số việc đang chạy
+    và đang chờ bị chặn ở workers + queue_limit: vượt quá thì báo bận ngay
+    thay vì để cả loạt login chiếm hết CPU của các trang khác.
+    """
+
+    def __init__(self, workers=None, queue_limit=None):
+        workers = workers or Config.AUTH_WORKERS
+        queue_limit = Config.AUTH_QUEUE_LIMIT if queue_limit is None else queue_limit
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auth')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusyError('Quá nhiều yêu cầu đăng nhập/đăng ký đang chờ xử lý')
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future.result()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Executor dùng chung cho cả process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = AuthExecutor()
+        return _executor
 
 class SimpleAuth:
+    def __init__(self, rounds=None, executor=None):
+        self.rounds = rounds or Config.AUTH_BCRYPT_ROUNDS
+        self.executor = executor or get_executor()
+
     @staticmethod
-    def hash_password(password):
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    
+    def _hash(password, rounds):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
     @staticmethod
-    def verify_password(password, hashed):
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
\ No newline at end of file
+    def _check(password, hashed):
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def hash_password(self, password):
+        return self.executor.run(self._hash, password, self.rounds)
+
+    def verify_password(self, password, hashed):
+        return self.executor.run(self._check, password, hashed)
+
+    def needs_rehash(self, hashed):
+        """Hash được tạo với cost khác cấu hình hiện tại ('$2b$<cost>$...')"""
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
@@ -0,0 +1,144 @@
+import threading
+
+class CategoryTree:
+    """Cây danh mục dựng sẵn: tập con cháu của mỗi node và danh sách sản phẩm theo danh mục"""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._versions = None
+        self._clear()
+        db.subscribe('products.json', self.refresh_product)
+        db.subscribe('categories.json', self.invalidate)
+
+    def _clear(self):
+        self.categories = {}      # category_id -> category
+        self.children = {}        # category_id -> [category_id con]
+        self.descendants = {}     # category_id -> frozenset gồm chính nó và mọi con cháu
+        self.postings = {}        # category_id -> set(product_id) gắn trực tiếp
+        self.product_category = {}  # product_id -> category_id
+        self._product_ids = {}    # category_id -> frozenset(product_id) của cả cây con
+
+    def _ensure_fresh(self):
+        # Thay đổi trong process này đến qua subscribe, của process khác thì qua version
+        versions = (self.db.version('categories.json'), self.db.version('products.json'))
+        if self._versions is None or versions[0] != self._versions[0]:
+            self._rebuild(versions)
+        elif versions[1] != self._versions[1]:
+            self._sync_products(versions)
+
+    def _rebuild(self, versions):
+        self._clear()
+        for category in self.db.load('categories.json'):
+            self.categories[category['id']] = category
+            self.children.setdefault(category['id'], [])
+        for category in self.categories.values():
+            parent_id = category.get('parent_id')
+            if parent_id is not None:
+                self.children.setdefault(parent_id, []).append(category['id'])
+
+        for category_id in self.children:
+            self.descendants[category_id] = frozenset(self._walk(category_id))
+
+        for product in self.db.load('products.json'):
+            self._add_product(product['id'], product.get('category_id'))
+        self._versions = versions
+
+    def _sync_products(self, versions):
+        """Sản phẩm bị sửa từ process khác: chỉ sản phẩm đổi danh mục được chuyển chỗ"""
+        moved = False
+        changed = self.db.changed_ids('products.json', self._versions[1])
+        if changed is not None:
+            for product_id in changed:
+                product = self.db.get('products.json', product_id)
+                moved = self._move_product(product_id, product.get('category_id') if product else None,
+                                           product is not None) or moved
+        else:
+            seen = set()
+            for product in self.db.scan('products.json'):
+                seen.add(product['id'])
+                moved = self._move_product(product['id'], product.get('category_id'), True) or moved
+            for product_id in [product_id for product_id in self.product_category if product_id not in seen]:
+                moved = self._move_product(product_id, None, False) or moved
+        if moved:
+            self._product_ids.clear()
+        self._versions = versions
+
+    def _move_product(self, product_id, category_id, exists):
+        """Đặt sản phẩm vào danh mục (exists=False: bỏ hẳn), trả về True nếu có thay đổi"""
+        if product_id in self.product_category:
+            if exists and self.product_category[product_id] == category_id:
+                return False
+            self._remove_product(product_id)
+        elif not exists:
+            return False
+        if exists:
+            self._add_product(product_id, category_id)
+        return True
+
+    def _walk(self, category_id):
+        # Duyệt theo chiều sâu, bỏ qua node đã thăm để không lặp vô hạn nếu dữ liệu có vòng
+        seen = set()
+        stack = [category_id]
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            stack.extend(self.children.get(node, []))
+        return seen
+
+    def _add_product(self, product_id, category_id):
+        self.product_category[product_id] = category_id
+        self.postings.setdefault(category_id, set()).add(product_id)
+
+    def _remove_product(self, product_id):
+        category_id = self.product_category.pop(product_id, None)
+        if category_id in self.postings:
+            self.postings[category_id].discard(product_id)
+
+    def invalidate(self, category_id=None):
+        with self._lock:
+            self._versions = None
+
+    def refresh_product(self, product_id):
+        """Cập nhật danh sách sản phẩm theo danh mục khi một sản phẩm thay đổi"""
+        with self._lock:
+            if self._versions is None:
+                return
+            if product_id is None:
+                self._versions = None
+                return
+            product = self.db.get('products.json', product_id)
+            if self._move_product(product_id, product.get('category_id') if product else None, product is not None):
+                self._product_ids.clear()
+            self._versions = (self._versions[0], self.db.version('products.json'))
+
+    def product_ids(self, category_id):
+        """Tập id sản phẩm thuộc danh mục, tính cả mọi danh mục con cháu"""
+        with self._lock:
+            self._ensure_fresh()
+            ids = self._product_ids.get(category_id)
+            if ids is None:
+                ids = set()
+                for node in self.descendants.get(category_id, (category_id,)):
+                    ids |= self.postings.get(node, set())
+                ids = self._product_ids[category_id] = frozenset(ids)
+            return ids
+
+    def options(self):
+        """Danh mục theo thứ tự cây kèm độ sâu, dùng cho ô chọn danh mục"""
+        with self._lock:
+            self._ensure_fresh()
+            result = []
+            roots = [c for c in self.categories.values() if c.get('parent_id') not in self.categories]
+            stack = [(c['id'], 0) for c in reversed(roots)]
+            seen = set()
+            while stack:
+                category_id, depth = stack.pop()
+                if category_id in seen:
+                    continue
+                seen.add(category_id)
+                result.append(dict(self.categories[category_id], depth=depth))
+                stack.extend((child, depth + 1) for child in reversed(self.children.get(category_id, [])))
+            return result
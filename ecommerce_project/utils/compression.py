@@ -0,0 +1,117 @@
+import gzip
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    # Không có brotli thì chỉ nén gzip
+    brotli = None
+
+def coalesce(chunks, size):
+    """Gom các đoạn nhỏ (template stream ra từng mẩu vài byte) thành đoạn khoảng size byte"""
+    buffer = []
+    length = 0
+    # Không dùng chunk[:0].join: đoạn đầu là Markup thì các đoạn str sau sẽ bị escape
+    empty = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if empty is None:
+            empty = b'' if isinstance(chunk, bytes) else ''
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield empty.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield empty.join(buffer)
+
+class Compression:
+    """Nén gzip/brotli response theo Accept-Encoding của client.
+
+    Response chỉ được nén khi đủ min_size byte. Response stream được nén
+    dần và flush sau mỗi đoạn để trình duyệt vẫn nhận được phần đầu trang sớm.
+    File gửi bằng send_file (ảnh, file tĩnh đã nén sẵn) không bị đụng tới.
+    """
+
+    def __init__(self, level, brotli_quality, min_size, mimetypes, chunk_size):
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+        self.mimetypes = set(mimetypes)
+        self.chunk_size = chunk_size
+
+    def init_app(self, app):
+        app.after_request(self.compress)
+
+    def _encoding(self):
+        if brotli is not None and request.accept_encodings['br']:
+            return 'br'
+        if request.accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    def compress(self, response):
+        if response.status_code == 304:
+            return self._not_modified(response)
+        if (response.status_code < 200 or response.status_code in (204, 206)
+                or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.mimetype not in self.mimetypes):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self._encoding()
+        # Response stream không biết trước độ dài thì luôn nén; trang lỗi (404...) cũng là
+        # response "stream" nhưng có sẵn Content-Length
+        length = response.content_length
+        if encoding is None or (length is not None and length < self.min_size):
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.iter_encoded(), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if encoding == 'br':
+                response.set_data(brotli.compress(data, quality=self.brotli_quality))
+            else:
+                response.set_data(gzip.compress(data, compresslevel=self.level, mtime=0))
+        response.headers['Content-Encoding'] = encoding
+
+        # Bản nén khác byte với bản gốc nên ETag mạnh thành weak; If-None-Match so sánh
+        # kiểu weak nên 304 vẫn hoạt động
+        self._weaken_etag(response)
+        return response
+
+    def _not_modified(self, response):
+        """304 của trang mà bản 200 sẽ được nén: trả cùng ETag weak với bản 200 để
+        cache giữ đúng validator của bản đang có"""
+        if (response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.mimetype not in self.mimetypes):
+            return response
+        response.vary.add('Accept-Encoding')
+        if self._encoding() is not None:
+            self._weaken_etag(response)
+        return response
+
+    def _weaken_etag(self, response):
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+    def _stream(self, chunks, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+            compress, finish = compressor.compress, compressor.flush
+            flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        for chunk in coalesce(chunks, self.chunk_size):
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+from config import Config
+
+COUNTERS_TABLE = 'inventory.json'
+HOLDS_TABLE = 'reservations.json'
+
+class OutOfStockError(Exception):
+    """Không đủ hàng trống (tồn kho trừ phần đang được giữ) cho số lượng yêu cầu.
+
+    available là số lượng tối đa giỏ đó có được (phần giỏ đang giữ cộng hàng trống).
+    """
+
+    def __init__(self, product, available):
+        super().__init__(f"Sản phẩm {product['name']} chỉ còn {available}")
+        self.product = product
+        self.available = available
+
+class Inventory:
+    """Giữ hàng cho giỏ hàng và trừ tồn kho khi đặt hàng.
+
+    products.json giữ tồn kho thực (stock); inventory.json giữ bộ đếm số lượng
+    đang được giữ của từng sản phẩm (id = id sản phẩm), reservations.json giữ
+    từng lượt giữ của một giỏ cho một sản phẩm, hết hạn sau ttl giây. Hàng trống
+    = stock - held nên kiểm tra còn hàng chỉ đọc hai bản ghi, không cộng các lượt giữ.
+    Bộ đếm nằm ngoài products.json để việc giữ hàng không làm dựng lại chỉ mục
+    tìm kiếm/sắp xếp sản phẩm. Các hàm ghi nên được gọi trong giao dịch của thay
+    đổi giỏ hàng/đơn hàng tương ứng.
+    """
+
+    def __init__(self, db, ttl=None):
+        self.db = db
+        self.ttl = ttl or Config.RESERVATION_TTL
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # Không lượt giữ nào hết hạn trước thời điểm này: lượt giữ mới (kể cả của process
+        # khác) hết hạn sau ttl giây, muộn hơn mọi lượt đang có, nên lượt dọn trước đó bỏ qua ngay
+        self._next_expiry = 0
+
+    def held(self, product_id):
+        counter = self.db.get(COUNTERS_TABLE, product_id)
+        return counter['held'] if counter else 0
+
+    def available(self, product):
+        """Số lượng còn giữ được; chỉ đọc nên dùng được ngoài giao dịch để báo hết hàng sớm"""
+        return max((product.get('stock') or 0) - self.held(product['id']), 0)
+
+    def _hold(self, cart_id, product_id):
+        holds = self.db.find_by(HOLDS_TABLE, ('cart_id', 'product_id'), (cart_id, product_id))
+        return holds[0] if holds else None
+
+    def _add_held(self, product_id, delta):
+        if not delta:
+            return
+        counter = self.db.get(COUNTERS_TABLE, product_id)
+        if counter:
+            self.db.update(COUNTERS_TABLE, product_id, {'held': max(counter['held'] + delta, 0)})
+        else:
+            self.db.insert(COUNTERS_TABLE, {'id': product_id, 'held': max(delta, 0)})
+
+    def hold(self, cart_id, product, quantity):
+        """Giữ quantity sản phẩm cho giỏ cart_id (thay cho số đang giữ) và gia hạn lượt giữ.
+
+        Thiếu hàng thì raise OutOfStockError. Route nên xem available() trước khi mở
+        giao dịch để báo hết hàng ngay, không phải chờ khóa ghi.
+        """
+        with self.db.transaction():
+            # Đọc lại trong giao dịch: giỏ khác có thể vừa giữ mất phần hàng trống
+            product = self.db.get('products.json', product['id']) or product
+            hold = self._hold(cart_id, product['id'])
+            current = hold['quantity'] if hold else 0
+            extra = quantity - current
+            if extra > 0 and extra > self.available(product):
+                raise OutOfStockError(product, current + self.available(product))
+
+            self._add_held(product['id'], extra)
+            expires_at = time.time() + self.ttl
+            if hold:
+                self.db.update(HOLDS_TABLE, hold['id'], {'quantity': quantity, 'expires_at': expires_at})
+            else:
+                self.db.insert(HOLDS_TABLE, {
+                    'id': self.db.next_id(HOLDS_TABLE),
+                    'cart_id': cart_id,
+                    'product_id': product['id'],
+                    'quantity': quantity,
+                    'expires_at': expires_at
+                })
+
+    def release(self, cart_id, product_id):
+        """Bỏ lượt giữ của giỏ cho sản phẩm (xóa khỏi giỏ)"""
+        with self.db.transaction():
+            hold = self._hold(cart_id, product_id)
+            if hold:
+                self._add_held(product_id, -hold['quantity'])
+                self.db.delete(HOLDS_TABLE, hold['id'])
+
+    def confirm(self, cart_id, items):
+        """Trừ tồn kho cho các (product, quantity) của giỏ khi đặt hàng và bỏ lượt giữ.
+
+        Phần không còn được giữ (lượt giữ đã hết hạn) phải còn hàng trống, không thì
+        raise OutOfStockError; gọi trong giao dịch của đơn hàng để lỗi thì hủy cả đơn.
+        Trả về các sản phẩm vừa hết hàng.
+        """
+        sold_out = []
+        with self.db.transaction():
+            for product, quantity in items:
+                product = self.db.get('products.json', product['id']) or product
+                hold = self._hold(cart_id, product['id'])
+                held = hold['quantity'] if hold else 0
+                # Phần của giỏ này cộng phần chưa ai giữ, nhưng không quá tồn kho (admin có thể vừa giảm)
+                free = max(product['stock'] - max(self.held(product['id']) - held, 0), 0)
+                if quantity > free:
+                    raise OutOfStockError(product, free)
+
+                stock = product['stock'] - quantity
+                self.db.update('products.json', product['id'], {'stock': stock})
+                self._add_held(product['id'], -held)
+                if hold:
+                    self.db.delete(HOLDS_TABLE, hold['id'])
+                if stock <= 0:
+                    sold_out.append(product)
+        return sold_out
+
+    def release_expired(self):
+        """Bỏ các lượt giữ đã hết hạn, trả về số lượt đã bỏ"""
+        now = time.time()
+        if now < self._next_expiry:
+            return 0
+        with self.db.transaction():
+            expired = []
+            next_expiry = now + self.ttl
+            for hold in self.db.load(HOLDS_TABLE):
+                if hold['expires_at'] <= now:
+                    expired.append(hold)
+                else:
+                    next_expiry = min(next_expiry, hold['expires_at'])
+            for hold in expired:
+                self._add_held(hold['product_id'], -hold['quantity'])
+                self.db.delete(HOLDS_TABLE, hold['id'])
+        self._next_expiry = next_expiry
+        return len(expired)
+
+    # ==================== DỌN LƯỢT GIỮ HẾT HẠN ====================
+
+    def start(self, interval=None):
+        """Chạy thread dọn lượt giữ hết hạn trong process hiện tại (một lần cho mỗi process)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._sweep, args=(interval or Config.RESERVATION_SWEEP_INTERVAL,),
+                                            name='inventory-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._pid = None
+
+    def _sweep(self, interval):
+        while not self._stopping.wait(interval):
+            try:
+                self.release_expired()
+            except Exception as e:
+                print(f"❌ Lỗi khi bỏ lượt giữ hàng hết hạn: {e}")
@@ -0,0 +1,235 @@
+import atexit
+import collections
+import os
+import threading
+import time
+from config import Config
+
+JOBS_TABLE = 'jobs.json'
+FAILED_TABLE = 'jobs_failed.json'
+KEYS_TABLE = 'job_keys.json'
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class JobQueue:
+    """Hàng đợi việc chạy sau, lưu trong bảng jobs.json của DB đang dùng (JSON hoặc SQLite).
+
+    Việc được thêm trong cùng giao dịch với dữ liệu sinh ra nó nên không bị mất
+    hay chạy cho dữ liệu đã rollback. Handler chạy trong một giao dịch cùng với
+    việc xóa nó khỏi hàng đợi: lỗi thì mọi thay đổi của handler bị hủy và việc
+    được thử lại sau retry_delay * 2^(lần thử - 1) giây, quá max_attempts thì
+    được chuyển sang bảng jobs_failed.json để admin xem. jobs.json chỉ còn việc
+    đang chờ/đang chạy nên không phình ra theo số việc đã chạy; jobs_failed.json
+    chỉ giữ keep_failed việc lỗi gần nhất.
+    Việc có key thì mỗi key chỉ được thêm một lần khi việc còn trong hàng đợi và
+    key_ttl giây sau khi việc xong (key của việc xong được giữ trong job_keys.json).
+    Nhiều process cùng lấy việc an toàn vì việc được nhận trong giao dịch.
+    """
+
+    def __init__(self, db, max_attempts=None, retry_delay=None, timeout=None, key_ttl=None, keep_failed=None):
+        self.db = db
+        self.max_attempts = max_attempts or Config.JOB_MAX_ATTEMPTS
+        self.retry_delay = Config.JOB_RETRY_DELAY if retry_delay is None else retry_delay
+        self.timeout = timeout or Config.JOB_TIMEOUT
+        self.key_ttl = Config.JOB_KEY_TTL if key_ttl is None else key_ttl
+        self.keep_failed = keep_failed or Config.JOB_KEEP_FAILED
+        self._last_purge = 0
+        self._handlers = {}
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # Độ trễ các việc xong gần đây trong process này (việc xong không còn trong DB)
+        self._latencies = collections.deque(maxlen=200)
+        # Việc mới được commit (trong process này) thì đánh thức worker ngay, không chờ hết chu kỳ poll
+        db.subscribe(JOBS_TABLE, lambda record_id: self._wake.set())
+
+    def handler(self, kind):
+        """Decorator đăng ký handler(job) cho một loại việc.
+
+        Handler gọi dịch vụ bên ngoài (gửi email...) nên truyền job['key']
+        làm idempotency key vì việc có thể chạy lại sau lỗi.
+        """
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def enqueue(self, kind, payload, key=None, delay=0):
+        """Thêm việc; gọi trong giao dịch của thay đổi dữ liệu tương ứng.
+
+        Trả về việc mới hoặc việc cùng key còn trong hàng đợi; None nếu việc
+        cùng key vừa chạy xong (trong key_ttl giây).
+        """
+        now = time.time()
+        with self.db.transaction():
+            if key is not None:
+                existing = self.db.find_by(JOBS_TABLE, 'key', key)
+                if existing:
+                    return existing[0]
+                if any(done['expires_at'] > now for done in self.db.find_by(KEYS_TABLE, 'key', key)):
+                    return None
+            job = {
+                'id': self.db.next_id(JOBS_TABLE),
+                'kind': kind,
+                'key': key,
+                'payload': payload,
+                'status': 'pending',
+                'attempts': 0,
+                'run_at': now + delay,
+                'created_at': now,
+                'started_at': None,
+                'finished_at': None,
+                'error': None
+            }
+            self.db.insert(JOBS_TABLE, job)
+        return job
+
+    # ==================== CHẠY VIỆC ====================
+
+    def _due(self, now):
+        jobs = [job for job in self.db.find_by(JOBS_TABLE, 'status', 'pending') if job['run_at'] <= now]
+        # Process chết khi đang chạy việc: sau timeout thì việc được nhận lại
+        jobs += [job for job in self.db.find_by(JOBS_TABLE, 'status', 'running')
+                 if job['started_at'] + self.timeout <= now]
+        return jobs
+
+    def _claim(self):
+        now = time.time()
+        # Xem trước ngoài giao dịch: hàng đợi rỗng thì không cần khóa ghi
+        if not self._due(now):
+            return None
+        with self.db.transaction():
+            jobs = self._due(now)
+            if not jobs:
+                return None
+            job = min(jobs, key=lambda candidate: (candidate['run_at'], candidate['id']))
+            changes = {'status': 'running', 'started_at': now, 'attempts': job['attempts'] + 1}
+            self.db.update(JOBS_TABLE, job['id'], changes)
+        return dict(job, **changes)
+
+    def _run(self, job):
+        try:
+            handler = self._handlers.get(job['kind'])
+            if handler is None:
+                raise LookupError(f"Không có handler cho việc {job['kind']}")
+            with self.db.transaction():
+                handler(job)
+                self.db.delete(JOBS_TABLE, job['id'])
+                if job['key'] is not None and self.key_ttl > 0:
+                    self.db.insert(KEYS_TABLE, {'id': self.db.next_id(KEYS_TABLE), 'key': job['key'],
+                                                'expires_at': time.time() + self.key_ttl})
+            self._latencies.append(time.time() - job['created_at'])
+        except Exception as e:
+            # Lỗi được lưu vào việc để admin xem ở bảng điều khiển
+            error = f'{type(e).__name__}: {e}'
+            if job['attempts'] >= self.max_attempts:
+                with self.db.transaction():
+                    self.db.delete(JOBS_TABLE, job['id'])
+                    self.db.insert(FAILED_TABLE, dict(job, id=self.db.next_id(FAILED_TABLE), job_id=job['id'],
+                                                      status='failed', finished_at=time.time(), error=error))
+                    # Chỉ giữ keep_failed việc lỗi gần nhất (id tăng dần)
+                    failed = sorted(self.db.load(FAILED_TABLE), key=lambda row: row['id'])
+                    for old in failed[:max(len(failed) - self.keep_failed, 0)]:
+                        self.db.delete(FAILED_TABLE, old['id'])
+            else:
+                self.db.update(JOBS_TABLE, job['id'], {'status': 'pending', 'error': error,
+                                                       'run_at': time.time() + self.retry_delay * 2 ** (job['attempts'] - 1)})
+
+    def run_pending(self):
+        """Chạy mọi việc đến hạn trên thread hiện tại, trả về số việc đã chạy"""
+        count = 0
+        while True:
+            job = self._claim()
+            if job is None:
+                return count
+            self._run(job)
+            count += 1
+
+    def purge_keys(self):
+        """Xóa key đã hết hạn của việc đã xong, trả về số key đã xóa"""
+        now = time.time()
+        # Xem trước ngoài giao dịch: không có key hết hạn thì không cần khóa ghi
+        if not any(row['expires_at'] <= now for row in self.db.scan(KEYS_TABLE)):
+            return 0
+        with self.db.transaction():
+            expired = [row['id'] for row in self.db.scan(KEYS_TABLE) if row['expires_at'] <= now]
+            for record_id in expired:
+                self.db.delete(KEYS_TABLE, record_id)
+        return len(expired)
+
+    # ==================== WORKER ====================
+
+    def start(self, workers=None, poll_interval=None):
+        """Chạy worker thread trong process hiện tại (một lần cho mỗi process).
+
+        Gọi được nhiều lần: sau khi fork, process con tự khởi động worker riêng.
+        """
+        workers = Config.JOB_WORKERS if workers is None else workers
+        if workers <= 0 or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            poll_interval = poll_interval or Config.JOB_POLL_INTERVAL
+            self._threads = [threading.Thread(target=self._work, args=(poll_interval,),
+                                              name=f'jobs-{i}', daemon=True) for i in range(workers)]
+            for thread in self._threads:
+                thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=5):
+        """Dừng worker, chờ việc đang chạy xong (tối đa timeout giây)"""
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    def _work(self, poll_interval):
+        while not self._stopping.is_set():
+            try:
+                # Dọn key hết hạn mỗi phút một lần, cả khi hàng đợi luôn có việc
+                if time.time() - self._last_purge >= 60:
+                    self._last_purge = time.time()
+                    self.purge_keys()
+                if self.run_pending() == 0:
+                    self._wake.wait(poll_interval)
+                    self._wake.clear()
+            except Exception as e:
+                # Lỗi đọc DB...: đợi rồi thử lại, không để worker chết
+                print(f"❌ Worker hàng đợi lỗi: {e}")
+                self._stopping.wait(poll_interval)
+
+    # ==================== THEO DÕI ====================
+
+    def stats(self):
+        """Độ sâu hàng đợi và độ trễ (giây, từ lúc thêm tới lúc xong) của các việc xong gần đây trong process này.
+
+        'failed' đếm các việc lỗi còn giữ trong jobs_failed.json (tối đa keep_failed).
+        """
+        now = time.time()
+        pending = self.db.find_by(JOBS_TABLE, 'status', 'pending')
+        running = self.db.find_by(JOBS_TABLE, 'status', 'running')
+        # jobs_failed.json bị giới hạn keep_failed dòng nên đọc cả bảng vẫn nhẹ
+        failed = self.db.load(FAILED_TABLE)
+        latencies = list(self._latencies)
+        return {
+            'pending': len(pending),
+            'running': len(running),
+            'failed': len(failed),
+            'done': len(latencies),
+            'oldest_wait': max((now - job['created_at'] for job in pending if job['run_at'] <= now), default=0),
+            'latency_p50': percentile(latencies, 0.5),
+            'latency_p95': percentile(latencies, 0.95),
+            'recent_failures': sorted(failed, key=lambda job: job['id'], reverse=True)[:5],
+            'workers': len(self._threads)
+        }
@@ -0,0 +1,157 @@
+import base64
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from utils.search import fold
+
+# Khóa sắp xếp: (nhãn hiển thị, hàm tạo khóa); id luôn được thêm vào cuối để thứ tự ổn định
+SORTS = {
+    'default': ('Mặc định', lambda p: ()),
+    'newest': ('Mới nhất', lambda p: (-p['id'],)),
+    'price_asc': ('Giá tăng dần', lambda p: (p.get('price') or 0,)),
+    'price_desc': ('Giá giảm dần', lambda p: (-(p.get('price') or 0),)),
+    'name': ('Tên A-Z', lambda p: (fold(p.get('name')),)),
+    'stock': ('Còn nhiều hàng', lambda p: (-(p.get('stock') or 0),))
+}
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return tuple(json.loads(base64.urlsafe_b64decode(padded.encode('ascii'))))
+    except (ValueError, TypeError):
+        return None
+
+class ProductListing:
+    """Danh sách sản phẩm đã sắp xếp sẵn theo từng khóa, phân trang bằng keyset cursor.
+
+    Cursor là khóa của sản phẩm cuối trang trước nên trang sâu cũng chỉ tốn
+    một lần bisect như trang đầu.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._version = None
+        self.products = {}
+        self.sorted_keys = {}
+        db.subscribe('products.json', self.refresh_product)
+
+    def _key(self, sort, product):
+        return SORTS[sort][1](product) + (product['id'],)
+
+    def _ensure_fresh(self):
+        version = self.db.version('products.json')
+        if self._version is None:
+            self.products = {p['id']: p for p in self.db.load('products.json')}
+            self.sorted_keys = {
+                sort: sorted(self._key(sort, p) for p in self.products.values())
+                for sort in SORTS
+            }
+            self._version = version
+        elif version != self._version:
+            # Sửa từ process khác (mỗi đơn hàng trừ tồn kho): chỉ cập nhật sản phẩm đã đổi
+            changed = self.db.changed_ids('products.json', self._version)
+            if changed is not None:
+                for product_id in changed:
+                    self._put(product_id, self.db.get('products.json', product_id))
+            else:
+                seen = set()
+                for product in self.db.scan('products.json'):
+                    seen.add(product['id'])
+                    if self.products.get(product['id']) != product:
+                        self._put(product['id'], product)
+                for product_id in [product_id for product_id in self.products if product_id not in seen]:
+                    self._put(product_id, None)
+            self._version = version
+
+    def _put(self, product_id, product):
+        """Thay sản phẩm (None = xóa); chỉ danh sách có khóa sắp xếp đổi mới bị sửa"""
+        old = self.products.pop(product_id, None)
+        if product is not None:
+            self.products[product_id] = product
+        for sort, keys in self.sorted_keys.items():
+            old_key = self._key(sort, old) if old is not None else None
+            new_key = self._key(sort, product) if product is not None else None
+            if old_key == new_key:
+                continue
+            if old_key is not None:
+                keys.pop(bisect_left(keys, old_key))
+            if new_key is not None:
+                insort(keys, new_key)
+
+    def refresh_product(self, product_id):
+        with self._lock:
+            if self._version is None:
+                return
+            if product_id is None:
+                self._version = None
+                return
+            self._put(product_id, self.db.get('products.json', product_id))
+            self._version = self.db.version('products.json')
+
+    def count(self):
+        with self._lock:
+            self._ensure_fresh()
+            return len(self.products)
+
+    def page(self, sort='default', cursor=None, limit=24, product_ids=None, ranked_ids=None):
+        """Trả về (danh sách sản phẩm, cursor trang sau hoặc None).
+
+        product_ids: tập id được phép (lọc theo danh mục).
+        ranked_ids: danh sách id theo độ liên quan (kết quả tìm kiếm); khi có
+        và sort là 'default' thì giữ nguyên thứ tự liên quan.
+        """
+        if sort not in SORTS:
+            sort = 'default'
+        position = decode_cursor(cursor)
+
+        with self._lock:
+            self._ensure_fresh()
+
+            if ranked_ids is not None and sort == 'default':
+                # Thứ tự liên quan không có khóa cố định nên cursor là vị trí trong danh sách
+                start = position[0] if position and isinstance(position[0], int) else 0
+                items = []
+                next_cursor = None
+                for index in range(start, len(ranked_ids)):
+                    product_id = ranked_ids[index]
+                    if product_id not in self.products:
+                        continue
+                    if product_ids is not None and product_id not in product_ids:
+                        continue
+                    if len(items) == limit:
+                        next_cursor = encode_cursor([index])
+                        break
+                    items.append(dict(self.products[product_id]))
+                return items, next_cursor
+
+            allowed = product_ids
+            if ranked_ids is not None:
+                allowed = set(ranked_ids) if product_ids is None else set(ranked_ids) & set(product_ids)
+
+            keys = self.sorted_keys[sort]
+            try:
+                start = bisect_right(keys, position) if position else 0
+            except TypeError:
+                # Cursor của kiểu sắp xếp khác hoặc bị sửa tay thì quay về trang đầu
+                start = 0
+
+            items = []
+            next_cursor = None
+            last_key = None
+            for index in range(start, len(keys)):
+                key = keys[index]
+                product_id = key[-1]
+                if allowed is not None and product_id not in allowed:
+                    continue
+                if len(items) == limit:
+                    next_cursor = encode_cursor(list(last_key))
+                    break
+                items.append(dict(self.products[product_id]))
+                last_key = key
+            return items, next_cursor
@@ -0,0 +1,275 @@
+import cProfile
+import heapq
+import hmac
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, request, session, g, before_render_template, template_rendered
+from config import Config
+from utils.db import encode_json
+
+# Ngưỡng (giây) của histogram độ trễ theo route
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PHASES = ('json', 'bcrypt', 'template')
+
+class Metrics:
+    """Đo thời gian từng route và các điểm nóng (đọc/ghi DB, parse JSON, bcrypt, render).
+
+    Chỉ khi gọi init_app thì các hàm của db/auth mới bị bọc lại, nên khi tắt
+    METRICS_ENABLED ứng dụng không tốn thêm gì.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (route, method) -> [đếm theo từng bucket..., tổng thời gian, số request]
+        self.latency = {}
+        # (route, tên bộ đếm) -> giá trị cộng dồn
+        self.counters = {}
+        self.profile_rate = Config.PROFILE_SAMPLE_RATE
+        self.profile_dir = Config.PROFILE_DIR
+        self._slowest = []   # heap (thời gian, file .prof) của các request chậm nhất đã lưu
+
+    # ==================== GẮN VÀO ỨNG DỤNG ====================
+
+    def init_app(self, app, db, auth):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        before_render_template.connect(self._template_start, app)
+        template_rendered.connect(self._template_end, app)
+        self._wrap_db(db)
+        self._wrap_auth(auth)
+
+    def _timed(self, fn, phase):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(phase + '_seconds', time.perf_counter() - start)
+        return wrapper
+
+    def _counted(self, fn, name):
+        def wrapper(*args, **kwargs):
+            self.add(name, 1)
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def _wrap_db(self, db):
+        db.load = self._counted(db.load, 'db_load_calls')
+        db.save = self._counted(db.save, 'db_save_calls')
+        if not hasattr(db, '_read'):
+            # SQLiteDB không đọc/ghi file JSON
+            return
+
+        read = db._read
+        def timed_read(filename):
+            start = time.perf_counter()
+            rows = read(filename)
+            self.add('json_seconds', time.perf_counter() - start)
+            self.add('db_bytes_read', sum(stamp[1] for stamp in db._table_stamp(filename) if stamp))
+            return rows
+        db._read = timed_read
+
+        dump = db._dump
+        def counted_dump(filepath, data, sync=False):
+            dump(filepath, data, sync)
+            self.add('db_bytes_written', os.path.getsize(filepath))
+        db._dump = counted_dump
+
+        write = db._write
+        def counted_write(filename, entry):
+            write(filename, entry)
+            # Trong giao dịch thì bản ghi chỉ được ghi lúc commit (_append_entries)
+            if db.write_mode == 'log' and db._current_transaction() is None:
+                self.add('db_bytes_written', self._entry_size(entry))
+        db._write = counted_write
+
+        append_entries = db._append_entries
+        def counted_append(entries, recovering=False):
+            append_entries(entries, recovering)
+            self.add('db_bytes_written', sum(self._entry_size(e) for rows in entries.values() for e in rows))
+        db._append_entries = counted_append
+
+    def _entry_size(self, entry):
+        return len(encode_json(entry)) + 1
+
+    def _wrap_auth(self, auth):
+        # Đo trên thread của request nên gồm cả thời gian chờ trong hàng đợi bcrypt
+        auth.hash_password = self._timed(auth.hash_password, 'bcrypt')
+        auth.verify_password = self._timed(auth.verify_password, 'bcrypt')
+
+    # ==================== THEO TỪNG REQUEST ====================
+
+    def add(self, name, value):
+        current = getattr(self._local, 'current', None)
+        if current is not None:
+            current[name] = current.get(name, 0) + value
+
+    def _start(self):
+        self._local.current = {}
+        self._local.template_starts = []
+        g.metrics_start = time.perf_counter()
+        g.profiler = None
+        if self.profile_rate and random.random() < self.profile_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.profiler = profiler
+            except ValueError:
+                # Đã có profiler khác đang chạy trên thread này
+                pass
+
+    def _finish(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+
+        current = self._local.current or {}
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        if response.is_streamed:
+            # Template stream render sau after_request: chỉ ghi nhận khi đã gửi xong body,
+            # Server-Timing (gửi cùng header) chỉ có thời gian tới byte đầu tiên
+            response.response = self._observed(response.response, route, request.method, start, current)
+        else:
+            self._local.current = None
+            self.observe(route, request.method, elapsed, current)
+
+        # Chi tiết thời gian DB/bcrypt/render chỉ gửi cho người được xem metrics
+        if Config.METRICS_SERVER_TIMING and self.authorized():
+            timings = [f'total;dur={elapsed * 1000:.1f}']
+            timings += [f'{phase};dur={current[phase + "_seconds"] * 1000:.1f}'
+                        for phase in PHASES if phase + '_seconds' in current]
+            response.headers['Server-Timing'] = ', '.join(timings)
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            # Dừng khi server đóng response để đo cả body stream (render template)
+            endpoint = request.endpoint or 'unmatched'
+            response.call_on_close(lambda: self._stop_profile(profiler, start, endpoint))
+        return response
+
+    def authorized(self):
+        """Request của admin hoặc có header Authorization: Bearer <METRICS_TOKEN>"""
+        token = Config.METRICS_TOKEN
+        header = request.headers.get('Authorization', '')
+        if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return True
+        # Không có cookie phiên thì không đọc session (đọc session thêm Vary: Cookie vào response)
+        if current_app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+            return False
+        return session.get('role') == 'admin'
+
+    def _observed(self, body, route, method, start, current):
+        try:
+            yield from body
+        finally:
+            self._local.current = None
+            self.observe(route, method, time.perf_counter() - start, current)
+
+    def _stop_profile(self, profiler, start, endpoint):
+        profiler.disable()
+        self._keep_profile(profiler, time.perf_counter() - start, endpoint)
+
+    def _teardown(self, error=None):
+        # Request lỗi không qua after_request: vẫn phải tắt profiler của thread này
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+        self._local.current = None
+
+    def _template_start(self, sender, template, context, **extra):
+        starts = getattr(self._local, 'template_starts', None)
+        if starts is not None:
+            starts.append(time.perf_counter())
+
+    def _template_end(self, sender, template, context, **extra):
+        starts = getattr(self._local, 'template_starts', None)
+        if starts:
+            self.add('template_seconds', time.perf_counter() - starts.pop())
+
+    def observe(self, route, method, elapsed, counters):
+        with self._lock:
+            histogram = self.latency.get((route, method))
+            if histogram is None:
+                histogram = self.latency[(route, method)] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            bucket = bisect_left(LATENCY_BUCKETS, elapsed)
+            if bucket < len(LATENCY_BUCKETS):
+                histogram[bucket] += 1
+            histogram[-2] += elapsed
+            histogram[-1] += 1
+            for name, value in counters.items():
+                self.counters[(route, name)] = self.counters.get((route, name), 0) + value
+
+    # ==================== PROFILE ====================
+
+    def _keep_profile(self, profiler, elapsed, endpoint):
+        """Chỉ giữ file .prof của PROFILE_KEEP request chậm nhất"""
+        with self._lock:
+            if len(self._slowest) >= Config.PROFILE_KEEP and elapsed <= self._slowest[0][0]:
+                return
+        # Ghi file ngoài khóa: dump_stats có thể chạy GC, đóng body stream dở dang và gọi observe
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f'{elapsed * 1000:08.1f}ms-{endpoint}-{int(time.time())}.prof')
+        profiler.dump_stats(path)
+        evicted = None
+        with self._lock:
+            heapq.heappush(self._slowest, (elapsed, path))
+            if len(self._slowest) > Config.PROFILE_KEEP:
+                _, evicted = heapq.heappop(self._slowest)
+        if evicted is not None:
+            try:
+                os.remove(evicted)
+            except OSError:
+                pass
+
+    def slowest_profiles(self):
+        with self._lock:
+            return sorted(self._slowest, reverse=True)
+
+    # ==================== XUẤT DỮ LIỆU ====================
+
+    def prometheus(self):
+        """Dữ liệu theo định dạng text của Prometheus"""
+        def labels(**values):
+            return '{' + ','.join(f'{k}="{self._escape(v)}"' for k, v in values.items()) + '}'
+
+        lines = ['# HELP app_request_duration_seconds Thời gian xử lý request theo route',
+                 '# TYPE app_request_duration_seconds histogram']
+        with self._lock:
+            latency = sorted(self.latency.items())
+            counters = sorted(self.counters.items())
+
+        for (route, method), histogram in latency:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram):
+                cumulative += count
+                lines.append(f'app_request_duration_seconds_bucket{labels(route=route, method=method, le=bound)} {cumulative}')
+            lines.append(f'app_request_duration_seconds_bucket{labels(route=route, method=method, le="+Inf")} {histogram[-1]}')
+            lines.append(f'app_request_duration_seconds_sum{labels(route=route, method=method)} {histogram[-2]:.6f}')
+            lines.append(f'app_request_duration_seconds_count{labels(route=route, method=method)} {histogram[-1]}')
+
+        families = [
+            ('app_db_calls_total', 'counter', 'Số lần gọi load/save của DB', 'op',
+             {'db_load_calls': 'load', 'db_save_calls': 'save'}),
+            ('app_db_bytes_total', 'counter', 'Số byte file dữ liệu đã đọc/ghi', 'direction',
+             {'db_bytes_read': 'read', 'db_bytes_written': 'written'}),
+            ('app_phase_seconds_total', 'counter', 'Thời gian cho parse JSON, bcrypt và render template', 'phase',
+             {phase + '_seconds': phase for phase in PHASES})
+        ]
+        for family, kind, help_text, label, names in families:
+            lines.append(f'# HELP {family} {help_text}')
+            lines.append(f'# TYPE {family} {kind}')
+            for (route, name), value in counters:
+                if name in names:
+                    number = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{family}{labels(route=route, **{label: names[name]})} {number}')
+        return '\n'.join(lines) + '\n'
+
+    def _escape(self, value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,98 @@
+import csv
+import io
+import json
+from datetime import date, timedelta
+from itertools import islice
+from utils.listing import encode_cursor
+
+# Số đơn được gắn item/người dùng trong một lượt khi duyệt dài (trang quản trị, xuất file)
+ORDER_BATCH = 200
+
+EXPORT_COLUMNS = ['order_id', 'created_at', 'status', 'user_id', 'user_name', 'user_email',
+                  'order_total', 'product_id', 'product_name', 'quantity', 'price']
+
+def valid_day(value):
+    """value dạng 'YYYY-MM-DD' nếu là ngày hợp lệ, không thì None (bỏ qua bộ lọc)"""
+    try:
+        return date.fromisoformat(value).isoformat() if value else None
+    except ValueError:
+        return None
+
+def iter_orders(db, status=None, user_id=None, date_from=None, date_to=None, before_id=None):
+    """Duyệt đơn hàng mới nhất trước theo bộ lọc, từng bản ghi một.
+
+    date_from/date_to dạng 'YYYY-MM-DD', tính cả hai đầu; before_id là id
+    của đơn cuối trang trước. Bộ lọc được chuyển cho db.query nên SQLite lọc
+    bằng WHERE thay vì đọc cả bảng.
+    """
+    where = []
+    if user_id is not None:
+        where.append(('user_id', '=', user_id))
+    if status:
+        where.append(('status', '=', status))
+    # created_at dạng 'YYYY-MM-DD HH:MM:SS' nên so sánh chuỗi theo ngày được
+    if date_from:
+        where.append(('created_at', '>=', date_from))
+    if date_to:
+        where.append(('created_at', '<', (date.fromisoformat(date_to) + timedelta(days=1)).isoformat()))
+    if before_id is not None:
+        where.append(('id', '<', before_id))
+    return db.query('orders.json', where, reverse=True)
+
+def batched(iterable, size=ORDER_BATCH):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class OrderPage:
+    """Một trang đơn hàng được gắn dữ liệu theo từng lô khi template duyệt tới.
+
+    next_cursor chỉ có giá trị sau khi đã duyệt hết trang, nên template phải
+    đọc nó sau vòng lặp.
+    """
+
+    def __init__(self, orders, limit, hydrate, batch_size=50):
+        self._orders = iter(orders)
+        self.limit = limit
+        self._hydrate = hydrate
+        self._batch_size = batch_size
+        self.next_cursor = None
+
+    def __iter__(self):
+        last_id = None
+        for batch in batched(islice(self._orders, self.limit), self._batch_size):
+            for order in self._hydrate(batch):
+                last_id = order['id']
+                yield order
+        if last_id is not None and next(self._orders, None) is not None:
+            self.next_cursor = encode_cursor([last_id])
+
+def csv_rows(orders):
+    """Mỗi order item một dòng CSV; đơn không có item vẫn có một dòng"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    # BOM để Excel nhận đúng UTF-8 (tên tiếng Việt)
+    yield '\ufeff' + buffer.getvalue()
+
+    for order in orders:
+        buffer.seek(0)
+        buffer.truncate()
+        base = [order['id'], order.get('created_at'), order.get('status'), order['user_id'],
+                order.get('user_name'), order.get('user_email'), order['total']]
+        for item in order['order_items'] or [{}]:
+            writer.writerow(base + [item.get('product_id'), item.get('product_name'),
+                                    item.get('quantity'), item.get('price')])
+        yield buffer.getvalue()
+
+def ndjson_rows(orders):
+    """Mỗi đơn hàng (kèm items) một dòng JSON"""
+    for order in orders:
+        items = [{key: item.get(key) for key in ('product_id', 'product_name', 'quantity', 'price')}
+                 for item in order['order_items']]
+        yield json.dumps(dict(order, order_items=items), ensure_ascii=False) + '\n'
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+CATALOG_TABLE = 'catalog.json'
+CATALOG_ID = 1
+
+class CatalogVersion:
+    """Số phiên bản của danh mục (sản phẩm, danh mục), lưu trong catalog.json.
+
+    Mọi thay đổi làm đổi trang danh mục (thêm/sửa/xóa sản phẩm) phải gọi bump()
+    trong cùng giao dịch; tồn kho trừ khi đặt hàng thì được gộp lại, bump chậm tối
+    đa CATALOG_REFRESH_INTERVAL giây (hết hàng thì bump ngay). Vì nằm trong DB nên
+    mọi worker/process thấy cùng một phiên bản và tạo cùng ETag.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def current(self):
+        """(version, updated_at dạng datetime có múi giờ)"""
+        row = self.db.get(CATALOG_TABLE, CATALOG_ID) or self.bump()
+        updated_at = datetime.strptime(row['updated_at'], '%Y-%m-%d %H:%M:%S').astimezone(timezone.utc)
+        return row['version'], updated_at
+
+    def bump(self):
+        with self.db.transaction():
+            row = self.db.get(CATALOG_TABLE, CATALOG_ID)
+            values = {
+                'version': (row['version'] if row else 0) + 1,
+                'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            if row:
+                self.db.update(CATALOG_TABLE, CATALOG_ID, values)
+            else:
+                self.db.insert(CATALOG_TABLE, dict(values, id=CATALOG_ID))
+        return dict(values, id=CATALOG_ID)
+
+def template_stamp(folder):
+    """Thời điểm sửa template mới nhất: deploy template mới thì ETag/Last-Modified cũng đổi"""
+    latest = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+    return datetime.fromtimestamp(int(latest), timezone.utc)
+
+def recorded(chunks, done):
+    """Chuyển tiếp từng đoạn của chunks và gọi done(các đoạn) khi đã duyệt hết.
+
+    Dừng giữa chừng (client ngắt kết nối, lỗi khi render) thì không gọi done.
+    """
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    done(parts)
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+class PageCache:
+    """LRU các trang và fragment đã render, gắn với một phiên bản danh mục.
+
+    Khi phiên bản đổi (kể cả do process khác) thì bỏ toàn bộ cache cũ.
+    """
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+                self.misses += 1
+                return None
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, version, key, value):
+        with self._lock:
+            if version != self._version:
+                # Phiên bản đã đổi trong lúc render: không giữ bản cũ
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                    'version': self._version}
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+# Bố cục file (little-endian):
+#   MAGIC | bản ghi JSON nối tiếp nhau | slot cố định cho từng bản ghi (sắp theo id)
+#   | các index phụ (key, số thứ tự slot) | meta JSON | FOOTER (vị trí meta, MAGIC)
+# Index nằm chung file với dữ liệu để os.replace thay cả hai cùng lúc. Key của index cột
+# int là chính giá trị; cột chuỗi/tuple... dùng hash 64 bit của giá trị, khi tra thì so lại
+# giá trị trong bản ghi để bỏ các bản ghi trùng hash.
+MAGIC = b'SDBMAP01'
+FOOTER = struct.Struct('<Q8s')
+KEY = struct.Struct('<qI')
+ID = struct.Struct('<q')
+
+# Cột số nóng được lưu dạng int64 ngay trong slot thay vì trong JSON
+NUMERIC_FIELDS = ('price', 'stock', 'quantity', 'total')
+ABSENT = -2 ** 63       # bản ghi không có trường này, hoặc giá trị không phải int (nằm trong JSON)
+NULL = -2 ** 63 + 1     # giá trị None
+INT_MAX = 2 ** 63
+
+def _slot_struct(numeric):
+    return struct.Struct('<qQI' + 'q' * len(numeric))
+
+def is_record_store(head):
+    return head[:len(MAGIC)] == MAGIC
+
+def row_key(row, field):
+    if isinstance(field, tuple):
+        return tuple(row.get(f) for f in field)
+    return row.get(field)
+
+def _is_int_key(value):
+    return type(value) is int and NULL < value < INT_MAX
+
+def _int_key(value):
+    return NULL if value is None else value
+
+def _hash_key(value):
+    data = json.dumps(value, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return ID.unpack(hashlib.blake2b(data, digest_size=ID.size).digest())[0]
+
+def build(f, rows, index_fields, encode):
+    """Ghi rows (có thể là iterator) vào file nhị phân f đang mở theo định dạng RecordStore.
+
+    index_fields: các cột (hoặc tuple cột) có index phụ; cột chỉ có int (hoặc None) dùng
+    chính giá trị làm key, còn lại dùng hash.
+    """
+    slot_struct = _slot_struct(NUMERIC_FIELDS)
+    slots = []
+    keys = {field: [] for field in index_fields}
+    int_keys = {field: not isinstance(field, tuple) for field in index_fields}
+    f.write(MAGIC)
+    offset = len(MAGIC)
+    for row in rows:
+        rest = dict(row)
+        numbers = []
+        for field in NUMERIC_FIELDS:
+            if field not in rest:
+                numbers.append(ABSENT)
+            elif rest[field] is None:
+                del rest[field]
+                numbers.append(NULL)
+            elif type(rest[field]) is int and NULL < rest[field] < INT_MAX:
+                numbers.append(rest.pop(field))
+            else:
+                numbers.append(ABSENT)
+        data = encode(rest)
+        f.write(data)
+        slots.append((row['id'], offset, len(data), *numbers))
+        offset += len(data)
+
+        for field, entries in keys.items():
+            value = row_key(row, field)
+            if int_keys[field] and value is not None and not _is_int_key(value):
+                int_keys[field] = False
+            entries.append((value, row['id']))
+
+    slots.sort(key=lambda slot: slot[0])
+    slots_offset = offset
+    for start in range(0, len(slots), 4096):
+        f.write(b''.join(slot_struct.pack(*slot) for slot in slots[start:start + 4096]))
+    offset += slot_struct.size * len(slots)
+
+    position = {slot[0]: number for number, slot in enumerate(slots)}
+    indexes = []
+    for field, entries in keys.items():
+        make_key = _int_key if int_keys[field] else _hash_key
+        entries = sorted((make_key(value), position[record_id]) for value, record_id in entries)
+        indexes.append([list(field) if isinstance(field, tuple) else field, offset, len(entries),
+                        'int' if int_keys[field] else 'hash'])
+        f.write(b''.join(KEY.pack(*entry) for entry in entries))
+        offset += KEY.size * len(entries)
+
+    meta = encode({'count': len(slots), 'slots': slots_offset,
+                   'numeric': list(NUMERIC_FIELDS), 'indexes': indexes})
+    f.write(meta)
+    f.write(FOOTER.pack(offset, MAGIC))
+
+class RecordStore:
+    """Đọc file RecordStore qua mmap; mỗi bản ghi chỉ được giải mã khi được lấy ra.
+
+    make đổi dict đã giải mã thành lớp bản ghi của bảng (mặc định giữ dict).
+    """
+
+    def __init__(self, path, decode, make=dict):
+        self.decode = decode
+        self.make = make
+        with open(path, 'rb') as f:
+            if os.name == 'nt':
+                # Windows không cho os.replace file đang được map nên đọc vào bộ nhớ
+                self.buffer = f.read()
+            else:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        end = len(self.buffer) - FOOTER.size
+        meta_offset, magic = FOOTER.unpack_from(self.buffer, end)
+        if not is_record_store(self.buffer) or magic != MAGIC:
+            raise ValueError(f'{path} không phải file RecordStore hợp lệ')
+        meta = decode(self.buffer[meta_offset:end])
+        self.count = meta['count']
+        self.numeric = meta['numeric']
+        indexes = meta['indexes']
+        if isinstance(indexes, dict):
+            # File cũ: chỉ có index cột int, {field: [offset, count]}
+            indexes = [[field, start, count, 'int'] for field, (start, count) in indexes.items()]
+        self.indexes = {(tuple(field) if isinstance(field, list) else field): (start, count, kind)
+                        for field, start, count, kind in indexes}
+        self._slots = meta['slots']
+        self._slot = _slot_struct(self.numeric)
+
+    def __len__(self):
+        return self.count
+
+    def _id_at(self, number):
+        return ID.unpack_from(self.buffer, self._slots + number * self._slot.size)[0]
+
+    def position(self, record_id):
+        """Số thứ tự slot của id (tìm nhị phân), None nếu không có"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._id_at(middle) < record_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._id_at(low) == record_id:
+            return low
+        return None
+
+    def record(self, number):
+        slot = self._slot.unpack_from(self.buffer, self._slots + number * self._slot.size)
+        row = self.decode(self.buffer[slot[1]:slot[1] + slot[2]])
+        for field, value in zip(self.numeric, slot[3:]):
+            if value == NULL:
+                row[field] = None
+            elif value != ABSENT:
+                row[field] = value
+        return row if self.make is dict else self.make(row)
+
+    def get(self, record_id):
+        number = self.position(record_id) if isinstance(record_id, int) else None
+        return self.record(number) if number is not None else None
+
+    def numeric_value(self, number, field):
+        """Đọc cột số của một slot mà không giải mã JSON; None nếu cột không nằm trong slot"""
+        if field not in self.numeric:
+            return None
+        slot = self._slot.unpack_from(self.buffer, self._slots + number * self._slot.size)
+        value = slot[3 + self.numeric.index(field)]
+        return None if value in (ABSENT, NULL) else value
+
+    def has_index(self, field):
+        return field in self.indexes
+
+    def find(self, field, value):
+        """Các bản ghi có field == value theo index phụ (theo thứ tự id)"""
+        start, count, kind = self.indexes[field]
+        if kind == 'hash':
+            # Cùng hash chưa chắc cùng giá trị: so lại trên bản ghi
+            return [row for row in self._find_key(start, count, _hash_key(value))
+                    if row_key(row, field) == value]
+        if value is not None and not _is_int_key(value):
+            return []
+        return self._find_key(start, count, _int_key(value))
+
+    def _find_key(self, start, count, value):
+        key_at = lambda i: KEY.unpack_from(self.buffer, start + i * KEY.size)
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if key_at(middle)[0] < value:
+                low = middle + 1
+            else:
+                high = middle
+        rows = []
+        while low < count:
+            key, number = key_at(low)
+            if key != value:
+                break
+            rows.append(self.record(number))
+            low += 1
+        return rows
+
+    def iter(self, reverse=False):
+        numbers = range(self.count - 1, -1, -1) if reverse else range(self.count)
+        for number in numbers:
+            yield self.record(number)
+
+    def max_id(self):
+        return self._id_at(self.count - 1) if self.count else 0
@@ -0,0 +1,191 @@
+class Record:
+    """Bản ghi gọn dùng __slots__ thay cho dict.
+
+    Vẫn dùng được như dict (row['name'], row.get(...), dict(row), 'price' in row)
+    để code và template cũ chạy nguyên, đồng thời đọc được bằng thuộc tính
+    (row.name). Slot chưa gán nghĩa là bản ghi không có trường đó; trường ngoài
+    FIELDS (vd. order_items gắn thêm lúc hiển thị) nằm trong _extra.
+
+    Chỉ bảng dạng RecordStore (mmap) dùng Record. Bảng nạp cả vào bộ nhớ giữ dict:
+    các thao tác kiểu dict ở đây chạy bằng Python nên tạo/sao chép/đọc chậm hơn
+    dict vài lần, không đáng với phần bộ nhớ tiết kiệm được.
+    """
+
+    __slots__ = ('_extra',)
+    FIELDS = ()
+    _field_set = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+
+    def __init__(self, row=None, **changes):
+        self._extra = None
+        if row is not None:
+            self._assign(row.items())
+        if changes:
+            self._assign(changes.items())
+
+    def _assign(self, items):
+        fields = self._field_set
+        for key, value in items:
+            if key in fields:
+                setattr(self, key, value)
+            elif self._extra is None:
+                self._extra = {key: value}
+            else:
+                self._extra[key] = value
+
+    def __getattr__(self, name):
+        # Chỉ được gọi khi slot chưa gán hoặc tên không phải slot
+        if name != '_extra' and self._extra and name in self._extra:
+            return self._extra[name]
+        raise AttributeError(name)
+
+    def to_dict(self):
+        row = {}
+        for name in self.FIELDS:
+            try:
+                row[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        if self._extra:
+            row.update(self._extra)
+        return row
+
+    def copy(self):
+        clone = self.__class__.__new__(self.__class__)
+        for name in self.FIELDS:
+            try:
+                setattr(clone, name, getattr(self, name))
+            except AttributeError:
+                pass
+        clone._extra = dict(self._extra) if self._extra else None
+        return clone
+
+    # ==================== GIAO DIỆN KIỂU DICT ====================
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._assign(((key, value),))
+
+    def __delitem__(self, key):
+        if key in self._field_set:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._field_set:
+            return hasattr(self, key)
+        return bool(self._extra) and key in self._extra
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            return getattr(self, key, default)
+        return self._extra.get(key, default) if self._extra else default
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def values(self):
+        return self.to_dict().values()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def update(self, other=(), **changes):
+        self._assign(other.items() if hasattr(other, 'items') else other)
+        self._assign(changes.items())
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        if not isinstance(other, dict):
+            return NotImplemented
+        return self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.to_dict()!r})'
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self._extra = None
+        self._assign(state.items())
+
+# Thứ tự FIELDS giống SCHEMAS của SQLiteDB, cũng là thứ tự trường khi ghi ra file
+
+class Product(Record):
+    __slots__ = FIELDS = ('id', 'name', 'price', 'stock', 'category_id', 'description', 'image')
+
+class Category(Record):
+    __slots__ = FIELDS = ('id', 'name', 'parent_id')
+
+class User(Record):
+    __slots__ = FIELDS = ('id', 'name', 'email', 'password_hash', 'role')
+
+class Cart(Record):
+    __slots__ = FIELDS = ('id', 'user_id', 'active')
+
+class CartItem(Record):
+    __slots__ = FIELDS = ('id', 'cart_id', 'product_id', 'quantity')
+
+class Order(Record):
+    __slots__ = FIELDS = ('id', 'user_id', 'total', 'status', 'created_at')
+
+class OrderItem(Record):
+    __slots__ = FIELDS = ('id', 'order_id', 'product_id', 'quantity', 'price')
+
+RECORDS = {
+    'products.json': Product,
+    'categories.json': Category,
+    'users.json': User,
+    'carts.json': Cart,
+    'cart_items.json': CartItem,
+    'orders.json': Order,
+    'order_items.json': OrderItem
+}
+
+def record_class(filename):
+    """Lớp bản ghi của bảng dạng RecordStore; bảng không khai báo (stats...) vẫn dùng dict"""
+    return RECORDS.get(filename, dict)
+
+def to_json(obj):
+    """Hàm default cho orjson/json: đổi Record về dict khi ghi ra file"""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f'{type(obj).__name__} không ghi được ra JSON')
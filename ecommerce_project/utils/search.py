@@ -0,0 +1,222 @@
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+# Tên sản phẩm quan trọng hơn mô tả nên token trong tên được tính nhiều lần hơn
+NAME_WEIGHT = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Token ngắn hơn mức này chỉ khớp chính xác, không mở rộng theo tiền tố
+MIN_PREFIX = 2
+# Khớp theo tiền tố có điểm thấp hơn khớp nguyên từ
+PREFIX_PENALTY = 0.8
+# Số truy vấn được giữ sẵn kết quả đã xếp hạng: trang sau của cùng truy vấn không phải xếp hạng lại
+RESULT_CACHE_SIZE = 256
+
+def fold(text):
+    """Bỏ dấu tiếng Việt và đưa về chữ thường: 'Điện thoại' -> 'dien thoai'"""
+    text = unicodedata.normalize('NFD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return text.replace('đ', 'd').replace('Đ', 'D').lower()
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', fold(text))
+
+class ProductSearch:
+    """Chỉ mục đảo ngược trên tên + mô tả sản phẩm, xếp hạng bằng BM25"""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._built = False
+        self._version = None
+        self._clear()
+        db.subscribe('products.json', self.refresh_product)
+
+    def _clear(self):
+        self.texts = {}        # product_id -> (tên, mô tả) đã đưa vào chỉ mục
+        self.postings = {}     # term -> {product_id: tf}
+        self.doc_terms = {}    # product_id -> {term: tf}
+        self.doc_length = {}   # product_id -> số token
+        self.doc_norm = {}     # product_id -> hệ số chuẩn hóa độ dài của BM25
+        self.total_length = 0
+        self.terms = []        # danh sách term đã sắp xếp để tìm theo tiền tố
+        self._results = OrderedDict()  # tokens của truy vấn -> tuple id đã xếp hạng
+
+    def _ensure_fresh(self):
+        # Thay đổi trong process này đã được cập nhật qua subscribe;
+        # sản phẩm bị sửa từ process khác thì chỉ đánh lại chỉ mục sản phẩm đổi tên/mô tả
+        version = self.db.version('products.json')
+        if not self._built:
+            self._rebuild(version)
+        elif version != self._version:
+            self._sync(version)
+
+    def _rebuild(self, version):
+        self._clear()
+        for product in self.db.load('products.json'):
+            self._add(product)
+        # Tính lại hệ số độ dài với độ dài trung bình mới; _add lẻ dùng giá trị gần đúng
+        avg_length = self._avg_length()
+        for product_id, length in self.doc_length.items():
+            self.doc_norm[product_id] = self._norm(length, avg_length)
+        self._built = True
+        self._version = version
+
+    def _sync(self, version):
+        """Áp thay đổi của process khác; đổi tồn kho/giá không đụng tới chỉ mục"""
+        changed = self.db.changed_ids('products.json', self._version)
+        if changed is not None:
+            for product_id in changed:
+                self._refresh(product_id, self.db.get('products.json', product_id))
+        else:
+            # Không biết sản phẩm nào đổi: so từng sản phẩm với bản đã đánh chỉ mục
+            seen = set()
+            for product in self.db.scan('products.json'):
+                seen.add(product['id'])
+                self._refresh(product['id'], product)
+            for product_id in [product_id for product_id in self.texts if product_id not in seen]:
+                self._remove(product_id)
+        self._version = version
+
+    def _refresh(self, product_id, product):
+        if product is None:
+            self._remove(product_id)
+        elif self.texts.get(product_id) != self._text(product):
+            self._remove(product_id)
+            self._add(product)
+
+    def _text(self, product):
+        return (product.get('name'), product.get('description'))
+
+    def _add(self, product):
+        counts = {}
+        tokens = tokenize(product.get('name')) * NAME_WEIGHT + tokenize(product.get('description'))
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+
+        product_id = product['id']
+        self.texts[product_id] = self._text(product)
+        self.doc_terms[product_id] = counts
+        self.doc_length[product_id] = len(tokens)
+        self.total_length += len(tokens)
+        self.doc_norm[product_id] = self._norm(len(tokens), self._avg_length())
+        for term, tf in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                insort(self.terms, term)
+            posting[product_id] = tf
+        self._results.clear()
+
+    def _remove(self, product_id):
+        counts = self.doc_terms.pop(product_id, None)
+        if counts is None:
+            return
+        self._results.clear()
+        del self.texts[product_id]
+        self.total_length -= self.doc_length.pop(product_id)
+        del self.doc_norm[product_id]
+        for term in counts:
+            posting = self.postings[term]
+            posting.pop(product_id, None)
+            if not posting:
+                del self.postings[term]
+                self.terms.pop(bisect_left(self.terms, term))
+
+    def _avg_length(self):
+        return self.total_length / len(self.doc_length) if self.doc_length else 1
+
+    def _norm(self, length, avg_length):
+        return BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_length or 1))
+
+    def refresh_product(self, product_id):
+        """Cập nhật chỉ mục cho một sản phẩm vừa được thêm/sửa/xóa"""
+        with self._lock:
+            if not self._built:
+                return
+            if product_id is None:
+                # Cả bảng bị thay thế: dựng lại ở lần tìm tiếp theo
+                self._built = False
+                return
+            self._refresh(product_id, self.db.get('products.json', product_id))
+            self._version = self.db.version('products.json')
+
+    def _expand(self, token, prefix=True):
+        if token in self.postings and not prefix:
+            return {token: 1.0}
+        if len(token) < MIN_PREFIX:
+            return {token: 1.0} if token in self.postings else {}
+        expanded = {}
+        start = bisect_left(self.terms, token)
+        for term in self.terms[start:]:
+            if not term.startswith(token):
+                break
+            expanded[term] = 1.0 if term == token else PREFIX_PENALTY
+        return expanded
+
+    def search(self, query, limit=None):
+        """Trả về id sản phẩm theo độ liên quan; mọi từ trong query đều phải khớp.
+
+        Kết quả được giữ lại theo truy vấn cho tới khi chỉ mục đổi nên các trang
+        sau của cùng truy vấn không phải xếp hạng lại cả tập kết quả.
+        """
+        tokens = tuple(tokenize(query))
+        if not tokens:
+            return []
+
+        with self._lock:
+            self._ensure_fresh()
+            ranked = self._results.get(tokens)
+            if ranked is None:
+                ranked = self._results[tokens] = self._rank(tokens)
+                if len(self._results) > RESULT_CACHE_SIZE:
+                    self._results.popitem(last=False)
+            else:
+                self._results.move_to_end(tokens)
+        return list(ranked[:limit] if limit else ranked)
+
+    def _rank(self, tokens):
+        """Tuple id theo độ liên quan của mọi sản phẩm khớp"""
+        doc_count = len(self.doc_length)
+
+        expansions = []
+        unique_tokens = list(dict.fromkeys(tokens))
+        for position, token in enumerate(unique_tokens):
+            # Từ cuối có thể đang gõ dở nên khớp theo tiền tố; các từ trước
+            # chỉ mở rộng khi không có từ nào khớp nguyên văn
+            terms = self._expand(token, prefix=position == len(unique_tokens) - 1)
+            if not terms:
+                return ()
+            size = sum(len(self.postings[term]) for term in terms)
+            expansions.append((size, terms))
+        # Từ hiếm nhất đi trước để tập ứng viên nhỏ ngay từ đầu
+        expansions.sort(key=lambda e: e[0])
+
+        scores = None
+        for size, terms in expansions:
+            token_scores = {}
+            for term, weight in terms.items():
+                posting = self.postings[term]
+                idf = weight * math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+                if scores is None or len(scores) >= len(posting):
+                    candidates = posting.items()
+                else:
+                    candidates = ((pid, posting[pid]) for pid in scores if pid in posting)
+                for product_id, tf in candidates:
+                    score = idf * tf * (BM25_K1 + 1) / (tf + self.doc_norm[product_id])
+                    if score > token_scores.get(product_id, 0):
+                        token_scores[product_id] = score
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pid: s + token_scores[pid] for pid, s in scores.items() if pid in token_scores}
+            if not scores:
+                return ()
+
+        rank_key = lambda pid: (-scores[pid], pid)
+        return tuple(sorted(scores, key=rank_key))
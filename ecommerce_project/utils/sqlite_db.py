@@ -0,0 +1,356 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config import Config
+from utils.db import SimpleDB, ConflictError, OPERATORS, matches
+
+# Cột thật của từng bảng (ngoài id); trường lạ được cất vào cột extra dạng JSON
+SCHEMAS = {
+    'users.json': [('name', 'TEXT'), ('email', 'TEXT'), ('password_hash', 'TEXT'), ('role', 'TEXT')],
+    'products.json': [('name', 'TEXT'), ('price', 'INTEGER'), ('stock', 'INTEGER'),
+                      ('category_id', 'INTEGER'), ('description', 'TEXT'), ('image', 'TEXT')],
+    'categories.json': [('name', 'TEXT'), ('parent_id', 'INTEGER')],
+    'carts.json': [('user_id', 'INTEGER'), ('active', 'BOOLEAN')],
+    'cart_items.json': [('cart_id', 'INTEGER'), ('product_id', 'INTEGER'), ('quantity', 'INTEGER')],
+    'orders.json': [('user_id', 'INTEGER'), ('total', 'INTEGER'), ('status', 'TEXT'), ('created_at', 'TEXT')],
+    'order_items.json': [('order_id', 'INTEGER'), ('product_id', 'INTEGER'),
+                         ('quantity', 'INTEGER'), ('price', 'INTEGER')],
+    # status_counts là dict nên nằm trong cột extra
+    'stats.json': [('total_orders', 'INTEGER'), ('total_revenue', 'INTEGER'),
+                   ('total_products', 'INTEGER'), ('total_users', 'INTEGER')],
+    'stats_daily.json': [('date', 'TEXT'), ('orders', 'INTEGER'), ('revenue', 'INTEGER')],
+    'catalog.json': [('version', 'INTEGER'), ('updated_at', 'TEXT')],
+    # payload là dict nên nằm trong cột extra
+    'jobs.json': [('kind', 'TEXT'), ('key', 'TEXT'), ('status', 'TEXT'), ('attempts', 'INTEGER'),
+                  ('run_at', 'REAL'), ('created_at', 'REAL'), ('started_at', 'REAL'),
+                  ('finished_at', 'REAL'), ('error', 'TEXT')],
+    'jobs_failed.json': [('job_id', 'INTEGER'), ('kind', 'TEXT'), ('key', 'TEXT'), ('attempts', 'INTEGER'),
+                         ('created_at', 'REAL'), ('finished_at', 'REAL'), ('error', 'TEXT')],
+    'job_keys.json': [('key', 'TEXT'), ('expires_at', 'REAL')],
+    'inventory.json': [('held', 'INTEGER')],
+    'reservations.json': [('cart_id', 'INTEGER'), ('product_id', 'INTEGER'), ('quantity', 'INTEGER'),
+                          ('expires_at', 'REAL')]
+}
+
+# Giới hạn số tham số trong một câu IN (...)
+IN_CHUNK = 500
+
+class SQLiteDB:
+    """Backend SQLite có cùng giao diện với SimpleDB (load/save/get/find_by/...)"""
+
+    def __init__(self, path=None):
+        self.path = path or Config.SQLITE_PATH
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._local = threading.local()
+        self._ready = set()
+        self._ready_lock = threading.Lock()
+        self._listeners = {}
+
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS _versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS _sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: tự quản lý BEGIN/COMMIT trong transaction()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=OFF')
+            self._local.conn = conn
+        return conn
+
+    def _table_name(self, filename):
+        name = filename[:-len('.json')] if filename.endswith('.json') else filename
+        if not re.fullmatch(r'[A-Za-z][A-Za-z0-9_]*', name):
+            raise ValueError(f'Tên bảng không hợp lệ: {filename}')
+        return name
+
+    def _columns(self, filename):
+        return SCHEMAS.get(filename, [])
+
+    def _ensure(self, filename):
+        if filename in self._ready:
+            return
+        table = self._table_name(filename)
+        columns = ''.join(f', "{name}" {kind}' for name, kind in self._columns(filename))
+        conn = self._conn()
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (id INTEGER PRIMARY KEY{columns}, extra TEXT)')
+
+        column_names = {name for name, _ in self._columns(filename)}
+        for field in SimpleDB.INDEXES.get(filename, []):
+            fields = field if isinstance(field, tuple) else (field,)
+            if fields == ('id',) or not set(fields) <= column_names:
+                continue
+            index_name = f'idx_{table}_' + '_'.join(fields)
+            quoted = ', '.join(f'"{f}"' for f in fields)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({quoted})')
+
+        with self._ready_lock:
+            self._ready.add(filename)
+
+    def _to_params(self, filename, record):
+        known = [name for name, _ in self._columns(filename)]
+        extra = {k: v for k, v in record.items() if k != 'id' and k not in known}
+        values = [record['id']] + [record.get(name) for name in known]
+        values.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+        return values
+
+    def _from_row(self, filename, row):
+        record = {'id': row['id']}
+        for name, kind in self._columns(filename):
+            value = row[name]
+            if kind == 'BOOLEAN' and value is not None:
+                value = bool(value)
+            record[name] = value
+        if row['extra']:
+            record.update(json.loads(row['extra']))
+        return record
+
+    def _query(self, filename, where='', params=()):
+        self._ensure(filename)
+        table = self._table_name(filename)
+        cursor = self._conn().execute(f'SELECT * FROM "{table}" {where} ORDER BY id', params)
+        return [self._from_row(filename, row) for row in cursor]
+
+    def _bump_version(self, filename):
+        self._conn().execute(
+            'INSERT INTO _versions (name, version) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET version = version + 1', (filename,))
+
+    # ==================== ĐỌC ====================
+
+    def load(self, filename):
+        return self._query(filename)
+
+    def find_by(self, filename, field, value):
+        fields = field if isinstance(field, tuple) else (field,)
+        values = value if isinstance(field, tuple) else (value,)
+        column_names = {name for name, _ in self._columns(filename)} | {'id'}
+
+        if not set(fields) <= column_names:
+            # Trường nằm trong cột extra thì lọc bằng Python
+            return [row for row in self.load(filename)
+                    if tuple(row.get(f) for f in fields) == tuple(values)]
+
+        where = 'WHERE ' + ' AND '.join(f'"{f}" IS ?' for f in fields)
+        return self._query(filename, where, tuple(values))
+
+    def get(self, filename, record_id):
+        rows = self.find_by(filename, 'id', record_id)
+        return rows[0] if rows else None
+
+    def find_in(self, filename, field, values):
+        """Tìm một lượt các bản ghi có field thuộc values (WHERE field IN ...)"""
+        values = list(dict.fromkeys(values))
+        if field not in {name for name, _ in self._columns(filename)} | {'id'}:
+            wanted = set(values)
+            return [row for row in self.load(filename) if row.get(field) in wanted]
+
+        rows = []
+        for start in range(0, len(values), IN_CHUNK):
+            chunk = values[start:start + IN_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            rows.extend(self._query(filename, f'WHERE "{field}" IN ({placeholders})', chunk))
+        return rows
+
+    def get_order_items(self, order_ids):
+        """Item của các đơn hàng kèm product_name, JOIN ngay trong SQL"""
+        self._ensure('order_items.json')
+        self._ensure('products.json')
+        order_ids = list(order_ids)
+        items = []
+        for start in range(0, len(order_ids), IN_CHUNK):
+            chunk = order_ids[start:start + IN_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor = self._conn().execute(
+                'SELECT oi.*, p.name AS product_name FROM order_items oi '
+                'LEFT JOIN products p ON p.id = oi.product_id '
+                f'WHERE oi.order_id IN ({placeholders}) ORDER BY oi.id', chunk)
+            for row in cursor:
+                item = self._from_row('order_items.json', row)
+                if row['product_name'] is not None:
+                    item['product_name'] = row['product_name']
+                items.append(item)
+        return items
+
+    def query(self, filename, where=(), reverse=False):
+        """Như SimpleDB.query: điều kiện trên cột thật thành WHERE, trên cột extra lọc bằng Python"""
+        column_names = {name for name, _ in self._columns(filename)} | {'id'}
+        clauses, params, rest = [], [], []
+        for field, op, value in where:
+            if op not in OPERATORS:
+                raise ValueError(f'Phép so sánh không hỗ trợ: {op}')
+            if field in column_names:
+                clauses.append(f'"{field}" IS ?' if op == '=' else f'"{field}" {op} ?')
+                params.append(value)
+            else:
+                rest.append((field, op, value))
+
+        for record in self._keyset(filename, clauses, params, reverse):
+            if matches(record, rest):
+                yield record
+
+    def scan(self, filename, reverse=False):
+        """Duyệt từng bản ghi theo id, đọc từng khối IN_CHUNK dòng bằng keyset"""
+        return self._keyset(filename, [], [], reverse)
+
+    def _keyset(self, filename, clauses, params, reverse):
+        self._ensure(filename)
+        table = self._table_name(filename)
+        op, direction = ('<', 'DESC') if reverse else ('>', 'ASC')
+        last_id = None
+        while True:
+            conditions = clauses + ([f'id {op} ?'] if last_id is not None else [])
+            where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+            values = params + ([last_id] if last_id is not None else [])
+            rows = self._conn().execute(
+                f'SELECT * FROM "{table}" {where} ORDER BY id {direction} LIMIT {IN_CHUNK}', values).fetchall()
+            for row in rows:
+                yield self._from_row(filename, row)
+            if len(rows) < IN_CHUNK:
+                return
+            last_id = rows[-1]['id']
+
+    def version(self, filename):
+        row = self._conn().execute('SELECT version FROM _versions WHERE name = ?', (filename,)).fetchone()
+        return row['version'] if row else 0
+
+    def changed_ids(self, filename, since):
+        # Không lưu lịch sử thay đổi: nơi gọi tự so lại cả bảng
+        return None
+
+    # ==================== GHI ====================
+
+    def subscribe(self, filename, callback):
+        self._listeners.setdefault(filename, []).append(callback)
+
+    def _changed(self, filename, record_id):
+        # Trong giao dịch thì đợi commit xong mới báo
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending.append((filename, record_id))
+            return
+        for callback in self._listeners.get(filename, []):
+            callback(record_id)
+
+    @contextmanager
+    def transaction(self):
+        if getattr(self._local, 'in_transaction', False):
+            yield
+            return
+
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.in_transaction = True
+        self._local.pending = []
+        try:
+            yield
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            self._local.in_transaction = False
+            pending, self._local.pending = self._local.pending, None
+
+        for filename, record_id in pending:
+            self._changed(filename, record_id)
+
+    def save(self, filename, data, expected_version=None):
+        self._ensure(filename)
+        table = self._table_name(filename)
+        with self.transaction():
+            if expected_version is not None and self.version(filename) != expected_version:
+                raise ConflictError(f'{filename} đã bị thay đổi, hãy tải lại rồi thử lại')
+            conn = self._conn()
+            conn.execute(f'DELETE FROM "{table}"')
+            if data:
+                placeholders = ', '.join('?' * (len(self._columns(filename)) + 2))
+                conn.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})',
+                                 [self._to_params(filename, item) for item in data])
+            self._bump_version(filename)
+            self._changed(filename, None)
+
+    def _upsert(self, filename, record):
+        self._ensure(filename)
+        table = self._table_name(filename)
+        placeholders = ', '.join('?' * (len(self._columns(filename)) + 2))
+        self._conn().execute(f'INSERT OR REPLACE INTO "{table}" VALUES ({placeholders})',
+                             self._to_params(filename, record))
+        self._bump_version(filename)
+
+    def insert(self, filename, record):
+        with self.transaction():
+            self._upsert(filename, record)
+            self._changed(filename, record['id'])
+        return record
+
+    def update(self, filename, record_id, changes):
+        with self.transaction():
+            record = self.get(filename, record_id)
+            if record is None:
+                return
+            record.update(changes)
+            self._upsert(filename, record)
+            self._changed(filename, record_id)
+
+    def delete(self, filename, record_id):
+        self._ensure(filename)
+        table = self._table_name(filename)
+        with self.transaction():
+            self._conn().execute(f'DELETE FROM "{table}" WHERE id = ?', (record_id,))
+            self._bump_version(filename)
+            self._changed(filename, record_id)
+
+    def next_id(self, filename):
+        self._ensure(filename)
+        table = self._table_name(filename)
+        with self.transaction():
+            conn = self._conn()
+            max_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{table}"').fetchone()[0]
+            row = conn.execute('SELECT value FROM _sequences WHERE name = ?', (filename,)).fetchone()
+            new_id = max((row['value'] if row else 0) + 1, max_id + 1)
+            conn.execute('INSERT INTO _sequences (name, value) VALUES (?, ?) '
+                         'ON CONFLICT(name) DO UPDATE SET value = excluded.value', (filename, new_id))
+        return new_id
+
+    def get_next_id(self, data_list):
+        if not data_list:
+            return 1
+        return max(item['id'] for item in data_list) + 1
+
+    # ==================== BẢO TRÌ ====================
+
+    def tables(self):
+        cursor = self._conn().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE '\\_%' ESCAPE '\\'")
+        return sorted(row['name'] + '.json' for row in cursor)
+
+    def compact(self, filename=None):
+        # Gộp WAL vào file chính, tương đương compact() của backend JSON
+        self._conn().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def invalidate(self, filename=None):
+        pass
+
+    def close(self):
+        """Đóng kết nối của thread hiện tại; lần dùng sau sẽ mở kết nối mới.
+
+        Phải gọi trước khi fork: kết nối SQLite không được dùng chung giữa các process.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    def cache_stats(self):
+        return {'hits': 0, 'misses': 0, 'tables': self.tables()}
@@ -0,0 +1,114 @@
+from datetime import date, datetime
+
+STATS_TABLE = 'stats.json'
+DAILY_TABLE = 'stats_daily.json'
+STATS_ID = 1
+
+class DashboardStats:
+    """Số liệu bảng điều khiển được cộng dồn theo từng thay đổi.
+
+    stats.json giữ một bản ghi tổng (đơn hàng, doanh thu, sản phẩm, người dùng,
+    số đơn theo trạng thái); stats_daily.json giữ số đơn và doanh thu từng ngày
+    với id là số thứ tự của ngày (date.toordinal) nên tra cứu theo ngày không cần index.
+    Các hàm cập nhật nên được gọi trong cùng giao dịch với thay đổi dữ liệu.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def _day_id(self, created_at):
+        try:
+            return datetime.strptime((created_at or '')[:10], '%Y-%m-%d').toordinal()
+        except ValueError:
+            return None
+
+    def rebuild(self):
+        """Tính lại toàn bộ số liệu từ orders/products/users"""
+        with self.db.transaction():
+            orders = self.db.load('orders.json')
+            status_counts = {}
+            daily = {}
+            for order in orders:
+                status_counts[order['status']] = status_counts.get(order['status'], 0) + 1
+                day_id = self._day_id(order.get('created_at'))
+                if day_id is not None:
+                    day = daily.setdefault(day_id, {'orders': 0, 'revenue': 0})
+                    day['orders'] += 1
+                    day['revenue'] += order['total']
+
+            stats = {
+                'id': STATS_ID,
+                'total_orders': len(orders),
+                'total_revenue': sum(order['total'] for order in orders),
+                'total_products': len(self.db.load('products.json')),
+                'total_users': len([u for u in self.db.load('users.json') if u['role'] == 'user']),
+                'status_counts': status_counts
+            }
+            self.db.save(STATS_TABLE, [stats])
+            self.db.save(DAILY_TABLE, [
+                {'id': day_id, 'date': date.fromordinal(day_id).isoformat(), **values}
+                for day_id, values in sorted(daily.items())
+            ])
+        return stats
+
+    def _adjust(self, changes, status_delta=None, day_id=None, day_revenue=0):
+        with self.db.transaction():
+            stats = self.db.get(STATS_TABLE, STATS_ID)
+            if stats is None:
+                # Chưa có số liệu: dựng từ dữ liệu gốc, vốn đã gồm thay đổi vừa ghi trong giao dịch
+                self.rebuild()
+                return
+
+            updates = {field: stats.get(field, 0) + delta for field, delta in changes.items()}
+            if status_delta:
+                status_counts = dict(stats.get('status_counts') or {})
+                for status, delta in status_delta.items():
+                    status_counts[status] = status_counts.get(status, 0) + delta
+                updates['status_counts'] = status_counts
+            self.db.update(STATS_TABLE, STATS_ID, updates)
+
+            if day_id is not None:
+                day = self.db.get(DAILY_TABLE, day_id)
+                if day is None:
+                    self.db.insert(DAILY_TABLE, {'id': day_id, 'date': date.fromordinal(day_id).isoformat(),
+                                                 'orders': 1, 'revenue': day_revenue})
+                else:
+                    self.db.update(DAILY_TABLE, day_id, {'orders': day['orders'] + 1,
+                                                         'revenue': day['revenue'] + day_revenue})
+
+    # ==================== CẬP NHẬT THEO SỰ KIỆN ====================
+
+    def order_placed(self, order):
+        self._adjust({'total_orders': 1, 'total_revenue': order['total']},
+                     status_delta={order['status']: 1},
+                     day_id=self._day_id(order.get('created_at')), day_revenue=order['total'])
+
+    def order_status_changed(self, old_status, new_status):
+        if old_status != new_status:
+            self._adjust({}, status_delta={old_status: -1, new_status: 1})
+
+    def user_registered(self, user):
+        if user.get('role') == 'user':
+            self._adjust({'total_users': 1})
+
+    def product_added(self):
+        self._adjust({'total_products': 1})
+
+    def product_removed(self):
+        self._adjust({'total_products': -1})
+
+    # ==================== ĐỌC ====================
+
+    def summary(self, days=7):
+        """Số liệu cho bảng điều khiển kèm doanh thu của `days` ngày gần nhất"""
+        stats = self.db.get(STATS_TABLE, STATS_ID) or self.rebuild()
+        status_counts = stats.get('status_counts') or {}
+
+        today = date.today().toordinal()
+        day_ids = range(today - days + 1, today + 1)
+        found = {day['id']: day for day in self.db.find_in(DAILY_TABLE, 'id', day_ids)}
+        daily = [found.get(day_id) or {'id': day_id, 'date': date.fromordinal(day_id).isoformat(),
+                                       'orders': 0, 'revenue': 0}
+                 for day_id in day_ids]
+
+        return dict(stats, pending_orders=status_counts.get('pending', 0), daily_revenue=daily)